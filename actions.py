@@ -34,30 +34,27 @@ class PickupAction(Action):
 
     def do(self, entity):
         pos = entity.get(Position)
-        items = [e for e in entity.level.position_system.get_entities_at(pos.x, pos.y) if e is not entity and e.has(Item)]
+        # pick up the whole pile at once, starting from the top
+        items = [e for e in reversed(entity.level.position_system.get_entities_at(pos.x, pos.y)) if e is not entity and e.has(Item)]
+        # quantities are taken before stacking, as an item can become a stack
+        picked = [(item, item.get(Item).quantity) for item in items]
         if items:
-            item = items[-1]
-            entity.level.remove_entity(item)
-            entity.get(Inventory).pickup(item)
-        else:
-            item = None
+            for item in items:
+                entity.level.remove_entity(item)
+            entity.get(Inventory).pickup_all(items)
 
-        entity.event('pickup', item)
+        entity.event('pickup', picked)
 
 
 class DropAction(Action):
 
     def do(self, entity):
         inventory = entity.get(Inventory)
-        if inventory.items:
-            item = inventory.items[-1]
-            inventory.items.remove(item)
-            item_pos = item.get(Position)
+        item = inventory.get_last()
+        if item is not None:
+            inventory.remove(item)
             entity_pos = entity.get(Position)
-            item_pos.x = entity_pos.x
-            item_pos.y = entity_pos.y
+            item.get(Position).move(entity_pos.x, entity_pos.y)
             entity.level.add_entity(item)
-        else:
-            item = None
 
         entity.event('drop', item)
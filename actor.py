@@ -7,6 +7,8 @@ class Actor(Component):
 
     COMPONENT_NAME = 'actor'
 
+    __slots__ = ('energy', 'speed', 'act_function')
+
     def __init__(self, speed, act_function):
         self.energy = 0
         self.speed = speed
@@ -0,0 +1,104 @@
+"""
+Batch layout generation
+
+Generates lots of level layouts on a process pool, e.g. for tuning
+LayoutGenerator parameters. Every layout is made from its own seed with
+the same layout stream a Level with that seed uses, so any interesting
+layout can be reproduced later. Results are small: the grid is stored
+zlib-compressed together with a few stats.
+
+Usage: python batchgen.py -n 10000 --max-rooms 30 --door-chance 0.5
+"""
+import argparse
+import cPickle
+import multiprocessing
+import time
+import zlib
+from collections import namedtuple
+
+from generator import LayoutGenerator, TileGrid
+from util import RandomStreams
+
+
+LayoutResult = namedtuple('LayoutResult', 'seed size_x size_y grid num_rooms floor_ratio generation_time')
+
+_FLOOR_TILES = (LayoutGenerator.TILE_FLOOR, LayoutGenerator.TILE_DOOR_CLOSED, LayoutGenerator.TILE_DOOR_OPEN)
+
+
+def generate_layout(seed, size_x, size_y, **params):
+    start = time.time()
+    layout = LayoutGenerator(size_x, size_y, rng=RandomStreams(seed).layout, **params)
+    layout.generate()
+    generation_time = time.time() - start
+
+    # grid is stored row by row, so the whole grid is one long row
+    tiles = layout.grid.get_row(0, 0, size_x * size_y)
+    floor_ratio = sum(tiles.count(tile) for tile in _FLOOR_TILES) / float(len(tiles))
+    return LayoutResult(seed, size_x, size_y, zlib.compress(tiles), len(layout.rooms), floor_ratio, generation_time)
+
+
+def decode_grid(result):
+    grid = TileGrid(result.size_x, result.size_y)
+    grid.set_row(0, 0, zlib.decompress(result.grid))
+    return grid
+
+
+def _generate_layout_task(args):
+    seed, size_x, size_y, params = args
+    return generate_layout(seed, size_x, size_y, **params)
+
+
+def generate_batch(seeds, size_x, size_y, processes=None, chunksize=16, **params):
+    """
+    Generate a layout for every seed on a pool of processes (one per CPU by
+    default) and yield results in the order of seeds. Extra keyword
+    arguments are passed to LayoutGenerator.
+    """
+    pool = multiprocessing.Pool(processes)
+    try:
+        tasks = ((seed, size_x, size_y, params) for seed in seeds)
+        for result in pool.imap(_generate_layout_task, tasks, chunksize):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate level layouts in parallel and print their stats.')
+    parser.add_argument('-n', '--count', type=int, default=1000, help='number of layouts')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='seed of the first layout, next ones use following numbers')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output', help='pickle list of results (as dicts of LayoutResult fields) to this file')
+    parser.add_argument('--size', type=int, nargs=2, default=(100, 100), metavar=('X', 'Y'))
+    parser.add_argument('--max-rooms', type=int, default=100)
+    parser.add_argument('--room-size-x', type=int, nargs=2, default=(7, 12), metavar=('MIN', 'MAX'))
+    parser.add_argument('--room-size-y', type=int, nargs=2, default=(7, 12), metavar=('MIN', 'MAX'))
+    parser.add_argument('--door-chance', type=float, default=0.75)
+    parser.add_argument('--open-door-chance', type=float, default=0.1)
+    args = parser.parse_args()
+
+    start = time.time()
+    results = list(generate_batch(
+        xrange(args.seed, args.seed + args.count), args.size[0], args.size[1], args.processes,
+        max_rooms=args.max_rooms,
+        room_size_x=tuple(args.room_size_x),
+        room_size_y=tuple(args.room_size_y),
+        door_chance=args.door_chance,
+        open_door_chance=args.open_door_chance,
+    ))
+    elapsed = time.time() - start
+
+    if args.output:
+        # plain dicts, so the file can be loaded without this module being __main__
+        with open(args.output, 'wb') as f:
+            cPickle.dump([result._asdict() for result in results], f, cPickle.HIGHEST_PROTOCOL)
+
+    for name in ('num_rooms', 'floor_ratio', 'generation_time'):
+        values = [getattr(result, name) for result in results]
+        print '%-16s min %.3f, avg %.3f, max %.3f' % (name, min(values), sum(values) / float(len(values)), max(values))
+    print '%d layouts in %.3f s (%d layouts/s)' % (len(results), elapsed, len(results) / elapsed)
+
+
+if __name__ == '__main__':
+    main()
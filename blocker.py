@@ -6,12 +6,15 @@ class Blocker(Component):
 
     COMPONENT_NAME = 'blocker'
 
+    __slots__ = ('_blocks_sight', '_blocks_movement', 'bump_function')
+
     def __init__(self, blocks_sight=False, blocks_movement=False, bump_function=None):
         self._blocks_sight = blocks_sight
-        self.blocks_movement = blocks_movement
+        self._blocks_movement = blocks_movement
         self.bump_function = bump_function or self.default_bump
 
     blocks_sight = event_property('_blocks_sight', 'blocks_sight_change')
+    blocks_movement = event_property('_blocks_movement', 'blocks_movement_change')
 
     @staticmethod
     def default_bump(blocker, who):
@@ -5,6 +5,8 @@ class Description(Component):
 
     COMPONENT_NAME = 'description'
 
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
 
@@ -1,8 +1,8 @@
 from description import Description
 from entity import Component, Entity
-from level import Blocker
+from blocker import Blocker
 from position import Position
-from render import Renderable
+from renderable import Renderable
 from temp import open_door_tex, closed_door_tex
 
 
@@ -10,6 +10,8 @@ class Door(Component):
 
     COMPONENT_NAME = 'door'
 
+    __slots__ = ('is_open',)
+
     def __init__(self, is_open=False):
         self.is_open = is_open
 
@@ -1,54 +1,294 @@
-from collections import defaultdict
+class Archetype(object):
+    """
+    Component names in the order components were added. Entities with the
+    same components share one archetype, which maps component names to
+    indexes in their component lists, so entities don't need a dict of
+    their own. Order matters, as component event handlers are called in
+    it, so the same components added in another order give another archetype.
+    """
+
+    __slots__ = ('names', 'index', '_with', '_without')
+
+    _archetypes = {}
+
+    def __init__(self, names):
+        self.names = names
+        self.index = dict((name, i) for i, name in enumerate(names))
+        self._with = {}
+        self._without = {}
+
+    @classmethod
+    def get(cls, names):
+        names = tuple(names)
+        archetype = cls._archetypes.get(names)
+        if archetype is None:
+            archetype = cls._archetypes[names] = cls(names)
+        return archetype
+
+    def with_component(self, name):
+        archetype = self._with.get(name)
+        if archetype is None:
+            archetype = self._with[name] = Archetype.get(self.names + (name,))
+        return archetype
+
+    def without_component(self, name):
+        archetype = self._without.get(name)
+        if archetype is None:
+            archetype = self._without[name] = Archetype.get(n for n in self.names if n != name)
+        return archetype
+
+    def __repr__(self):
+        return '<Archetype %s>' % ', '.join(map(str, self.names))
 
 
 class Entity(object):
 
+    __slots__ = ('level', '_archetype', '_components', '_event_handlers', '_dispatch')
+
     def __init__(self, *components):
         self.level = None
-        self._components = {}
-        self._event_handlers = defaultdict(set)
-        for component in components:
-            self.add(component)
+        self._archetype = Archetype.get(())
+        self._components = []
+        self._event_handlers = None # created on first listen
+        self._dispatch = None # created on first event
+        if components:
+            # set all components at once instead of going through an archetype for each
+            names = [component.COMPONENT_NAME for component in components]
+            if len(set(names)) != len(names):
+                raise RuntimeError('Trying to add duplicate components: %r' % (components,))
+            self._archetype = Archetype.get(names)
+            self._components = list(components)
+            for component in components:
+                assert isinstance(component, Component)
+                component.owner = self
 
     def add(self, component):
         assert isinstance(component, Component)
         if self.has(component):
             raise RuntimeError('Trying to add duplicate component with name %s: %r' % (component.COMPONENT_NAME, component))
-        self._components[component.COMPONENT_NAME] = component
+        old_archetype = self._archetype
+        self._archetype = old_archetype.with_component(component.COMPONENT_NAME)
+        self._components = self._components + [component]
+        self._dispatch = None
         component.owner = self
+        if self.level is not None:
+            self.level.components.update_entity(self, old_archetype)
 
     def remove(self, component):
         if not self.has(component):
             raise RuntimeError('Trying to remove component that is not added: %s' % component.COMPONENT_NAME)
         else:
-            component = self._components.pop(component.COMPONENT_NAME)
+            old_archetype = self._archetype
+            components = list(self._components)
+            component = components.pop(old_archetype.index[component.COMPONENT_NAME])
+            self._archetype = old_archetype.without_component(component.COMPONENT_NAME)
+            self._components = components
+            self._dispatch = None
             component.owner = None
+            if self.level is not None:
+                self.level.components.update_entity(self, old_archetype)
 
     def get(self, component):
-        return self._components.get(component.COMPONENT_NAME)
+        idx = self._archetype.index.get(component.COMPONENT_NAME)
+        if idx is None:
+            return None
+        return self._components[idx]
 
     def has(self, component):
-        return component.COMPONENT_NAME in self._components
+        return component.COMPONENT_NAME in self._archetype.index
+
+    @property
+    def archetype(self):
+        return self._archetype
 
     def listen(self, event_name, handler):
-        self._event_handlers[event_name].add(handler)
+        # handlers are kept in tuples, which are much smaller than sets
+        # for the usual one or two listeners
+        if self._event_handlers is None:
+            self._event_handlers = {}
+        handlers = self._event_handlers.get(event_name, ())
+        if handler not in handlers:
+            self._event_handlers[event_name] = handlers + (handler,)
+            self._invalidate_dispatch(event_name)
 
     def unlisten(self, event_name, handler):
-        if event_name in self._event_handlers:
-            self._event_handlers[event_name].remove(handler)
+        if self._event_handlers is not None and event_name in self._event_handlers:
+            handlers = self._event_handlers[event_name]
+            if handler not in handlers:
+                raise KeyError(handler)
+            handlers = tuple(h for h in handlers if h != handler)
+            if handlers:
+                self._event_handlers[event_name] = handlers
+            else:
+                del self._event_handlers[event_name]
+            self._invalidate_dispatch(event_name)
 
     def event(self, event_name, *data):
-        if event_name in self._event_handlers:
-            for handler in self._event_handlers[event_name]:
-                handler(self, *data)
-        for componment in self._components.values():
-            method = getattr(componment, 'on_' + event_name, None)
-            if method:
-                method(*data)
+        # listeners are called with the entity first, component handlers without it
+        try:
+            listeners, methods = self._dispatch[event_name]
+        except (TypeError, KeyError):
+            listeners, methods = self._build_dispatch(event_name)
+        for handler in listeners:
+            handler(self, *data)
+        for method in methods:
+            method(*data)
+
+    def _build_dispatch(self, event_name):
+        # dispatch table caches listeners and bound on_<event> methods of
+        # components for every event fired, it's dropped when components
+        # change and its entry is dropped when listeners of the event change
+        if self._dispatch is None:
+            self._dispatch = {}
+        listeners = ()
+        if self._event_handlers is not None:
+            listeners = self._event_handlers.get(event_name, ())
+        method_name = 'on_' + event_name
+        methods = tuple(getattr(component, method_name) for component in self._components if hasattr(component, method_name))
+        entry = self._dispatch[event_name] = listeners, methods
+        return entry
+
+    def _invalidate_dispatch(self, event_name):
+        if self._dispatch is not None:
+            self._dispatch.pop(event_name, None)
 
 
 class Component(object):
 
+    __slots__ = ('owner',) # set when added to entity
+
     COMPONENT_NAME = None # override for class
 
-    owner = None # set when added to entity
+
+class _ArchetypeTable(object):
+    # entities of one archetype; their components are only referenced from
+    # the entities themselves, at indexes given by the archetype
+    __slots__ = ('archetype', 'entities', 'rows')
+
+    def __init__(self, archetype):
+        self.archetype = archetype
+        self.entities = []
+        self.rows = {}
+
+    def add(self, entity):
+        self.rows[entity] = len(self.entities)
+        self.entities.append(entity)
+
+    def remove(self, entity):
+        # swap with the last row, so removal is O(1)
+        row = self.rows.pop(entity)
+        last = self.entities.pop()
+        if last is not entity:
+            self.entities[row] = last
+            self.rows[last] = row
+
+
+class ComponentStore(object):
+    """
+    Entities of a level grouped by archetype. Systems use query() to
+    iterate over all entities having some components in bulk, checking
+    only matching archetypes instead of every entity.
+    """
+
+    def __init__(self):
+        self._tables = {}
+        self._queries = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, entity):
+        table = self._tables.get(entity.archetype)
+        return table is not None and entity in table.rows
+
+    def __iter__(self):
+        for table in self._tables.values():
+            for entity in table.entities:
+                yield entity
+
+    def add_entity(self, entity):
+        self._get_table(entity.archetype).add(entity)
+        self._count += 1
+
+    def remove_entity(self, entity):
+        self._tables[entity.archetype].remove(entity)
+        self._count -= 1
+
+    def update_entity(self, entity, old_archetype):
+        """Move entity to its new archetype after a component was added or removed"""
+        self._tables[old_archetype].remove(entity)
+        self._get_table(entity.archetype).add(entity)
+
+    def query(self, *components):
+        """
+        Iterate over (entity, component1, component2, ...) tuples for all
+        entities that have all given components.
+        """
+        names = tuple(component.COMPONENT_NAME for component in components)
+        matches = self._queries.get(names)
+        if matches is None:
+            matches = [self._match(table, names) for table in self._tables.values()]
+            matches = self._queries[names] = [match for match in matches if match]
+
+        for table, indexes in matches:
+            for entity in table.entities:
+                components = entity._components
+                yield (entity,) + tuple(components[i] for i in indexes)
+
+    def _match(self, table, names):
+        index = table.archetype.index
+        if all(name in index for name in names):
+            return table, [index[name] for name in names]
+        return None
+
+    def _get_table(self, archetype):
+        table = self._tables.get(archetype)
+        if table is None:
+            table = self._tables[archetype] = _ArchetypeTable(archetype)
+            # update cached queries with the new table
+            for names, matches in self._queries.iteritems():
+                match = self._match(table, names)
+                if match:
+                    matches.append(match)
+        return table
+
+
+if __name__ == '__main__':
+    # benchmark event throughput of an entity with a typical number of components
+    # and listeners, using dispatch tables vs looking up handlers on every event
+    # (as it was done before)
+    import time
+
+    def make_component(name, handles):
+        cls = type(name, (Component,), {'COMPONENT_NAME': name.lower(), '__slots__': ()})
+        for event_name in handles:
+            setattr(cls, 'on_' + event_name, lambda self, *data: None)
+        return cls()
+
+    def listener(entity, *data):
+        pass
+
+    def uncached_event(entity, event_name, *data):
+        if entity._event_handlers is not None and event_name in entity._event_handlers:
+            for handler in entity._event_handlers[event_name]:
+                handler(entity, *data)
+        for componment in entity._components:
+            method = getattr(componment, 'on_' + event_name, None)
+            if method:
+                method(*data)
+
+    entity = Entity(*[make_component('Component%d' % i, ['move'] if i < 2 else ['take_damage'] if i == 2 else []) for i in xrange(10)])
+    entity.listen('move', listener)
+    entity.listen('move', lambda entity, *data: None)
+    events = [('move', (1, 2, 3, 4)), ('take_damage', (1, None)), ('bump', (None,)), ('health_update', ())] * 25
+
+    def measure(fire, rounds=2000):
+        start = time.time()
+        for i in xrange(rounds):
+            for event_name, data in events:
+                fire(entity, event_name, *data)
+        return rounds * len(events) / (time.time() - start)
+
+    print 'uncached: %d events/s' % measure(uncached_event)
+    print 'dispatch tables: %d events/s' % measure(Entity.event)
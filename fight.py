@@ -1,10 +1,13 @@
 from entity import Component
+from health import Health
 
 
 class Fighter(Component):
 
     COMPONENT_NAME = 'fighter'
 
+    __slots__ = ('attack', 'defense')
+
     def __init__(self, attack, defense):
         self.attack = attack
         self.defense = defense
@@ -14,3 +17,6 @@ class Fighter(Component):
         dmg = max(0, self.attack - target_fighter.defense)
         self.owner.event('do_damage', dmg, target)
         target.event('take_damage', dmg, self.owner)
+        # death is checked only after all take_damage handlers were called,
+        # so it doesn't depend on the order of target's components
+        target.get(Health).check_death(self.owner)
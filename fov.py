@@ -1,27 +1,64 @@
 from entity import Component
 from position import Position
-from shadowcaster import ShadowCaster
+from shadowcaster import GridShadowCaster
 
 
 class FOV(Component):
 
     COMPONENT_NAME = 'fov'
 
+    __slots__ = ('radius', 'lightmap', '_caster')
+
     def __init__(self, radius):
         self.radius = radius
         self.lightmap = {}
+        self._caster = None
+
+    def _get_caster(self, level):
+        # the caster reads level's blocker map directly, so it's reused while we're on the same level
+        if self._caster is None or self._caster.blocking is not level.sight_blockers:
+            self._caster = GridShadowCaster(level.size_x, level.size_y, level.sight_blockers)
+        return self._caster
 
     def update_light(self):
-        old_lightmap = self.lightmap.copy()
+        level = self.owner.level
         pos = self.owner.get(Position)
-        self.lightmap.clear()
-        self.lightmap[pos.x, pos.y] = 1
-        caster = ShadowCaster(self.owner.level.get_sight_blocker, self._set_light)
+        caster = self._get_caster(level)
         caster.calculate_light(pos.x, pos.y, self.radius)
-        self.owner.event('fov_updated', old_lightmap, self.lightmap)
+        self._update_lightmap(level, caster)
+
+    def update_cell(self, x, y):
+        """Update light after blocking state of the given cell has changed"""
+        level = self.owner.level
+        pos = self.owner.get(Position)
+        caster = self._get_caster(level)
+        if (caster.x, caster.y, caster.radius) != (pos.x, pos.y, self.radius):
+            self.update_light()
+        else:
+            caster.update_cell(x, y)
+            self._update_lightmap(level, caster)
 
-    def _set_light(self, x, y, intensity):
-        self.lightmap[x, y] = intensity
+    def _update_lightmap(self, level, caster):
+        # build the new lightmap, taking matching cells out of the old one, so
+        # only cells that became dark are left in it, and fire event with the
+        # lists of cells that became lit, became dark or changed intensity
+        old_lightmap = self.lightmap
+        lightmap = self.lightmap = {}
+        lit = []
+        changed = []
+
+        size_x = level.size_x
+        intensity = caster.intensity
+        for idx in caster.lit:
+            key = idx % size_x, idx // size_x
+            value = lightmap[key] = intensity[idx]
+            old_value = old_lightmap.pop(key, None)
+            if old_value is None:
+                lit.append(key)
+            elif old_value != value:
+                changed.append(key)
+
+        self.owner.event('fov_updated', lit, old_lightmap.keys(), changed)
 
     def is_in_fov(self, x, y):
         return self.lightmap.get((x, y), 0) > 0
@@ -34,5 +71,7 @@ class InFOV(Component):
 
     COMPONENT_NAME = 'in_fov'
 
+    __slots__ = ('in_fov',)
+
     def __init__(self):
         self.in_fov = False
@@ -4,6 +4,7 @@ import pyglet
 from command import Command
 from level import Level
 from message import MessageLog
+from render import RenderSystem
 
 
 class GameState(object):
@@ -95,12 +96,14 @@ class PlayLevelState(GameState):
         self._g_loop = greenlet.greenlet(self._loop)
         self.message_log = MessageLog()
         self.level = Level(self, self.DUNGEON_SIZE_X, self.DUNGEON_SIZE_Y)
+        self.render_system = RenderSystem(self.level, self.game.window)
         self.game.window.push_handlers(self)
         self._g_loop.switch()
 
     def exit(self):
         self.game.window.remove_handlers(self)
-        self.level.render_system.dispose()
+        self.render_system.dispose()
+        self.message_log.close()
 
     def on_key_press(self, sym, mod):
         key = pyglet.window.key
@@ -138,7 +141,7 @@ class PlayLevelState(GameState):
             self._g_loop.switch(command)
 
     def on_draw(self):
-        self.level.render_system.draw()
+        self.render_system.draw()
 
     def _loop(self):
         while True:
@@ -1,22 +1,76 @@
 import random
+from collections import defaultdict
 
 from util import randint_triangular
 
 
 class TileGrid(object):
+    """
+    Rectangular grid of tiles, stored row by row in a compact bytearray,
+    one byte per tile. Single tiles are accessed as grid[x, y], rectangular
+    regions are filled and checked with whole-row slice operations.
+    """
 
-    def __init__(self, size_x, size_y):
+    def __init__(self, size_x, size_y, fill=None):
         self.size_x = size_x
         self.size_y = size_y
-        self._contents = [LayoutGenerator.TILE_EMPTY for i in xrange(size_x * size_y)]
+        self._contents = bytearray((fill or LayoutGenerator.TILE_EMPTY) * (size_x * size_y))
 
     def __getitem__(self, xy):
         x, y = xy
-        return self._contents[y * self.size_x + x]
+        return chr(self._contents[y * self.size_x + x])
 
     def __setitem__(self, xy, tile):
         x, y = xy
-        self._contents[y * self.size_x + x] = tile
+        self._contents[y * self.size_x + x] = ord(tile)
+
+    def get_row(self, x, y, length):
+        start = y * self.size_x + x
+        return str(self._contents[start:start + length])
+
+    def set_row(self, x, y, row):
+        start = y * self.size_x + x
+        self._contents[start:start + len(row)] = row
+
+    def fill_rect(self, x, y, size_x, size_y, tile):
+        row = tile * size_x
+        for row_y in xrange(y, y + size_y):
+            self.set_row(x, row_y, row)
+
+
+class RectIndex(object):
+    """
+    Spatial hash of placed rectangles. Every rectangle is registered in all
+    square buckets it covers, so an overlap test only looks at the few
+    rectangles sharing buckets with the tested one, no matter how big the
+    map is or how many rectangles are placed.
+    """
+
+    def __init__(self, bucket_size=16):
+        self.bucket_size = bucket_size
+        self._buckets = defaultdict(list)
+
+    def _get_bucket_keys(self, x, y, size_x, size_y):
+        bucket_size = self.bucket_size
+        for bucket_x in xrange(x // bucket_size, (x + size_x - 1) // bucket_size + 1):
+            for bucket_y in xrange(y // bucket_size, (y + size_y - 1) // bucket_size + 1):
+                yield bucket_x, bucket_y
+
+    def add(self, x, y, size_x, size_y):
+        rect = (x, y, x + size_x, y + size_y)
+        for key in self._get_bucket_keys(x, y, size_x, size_y):
+            self._buckets[key].append(rect)
+
+    def intersects(self, x, y, size_x, size_y):
+        x2 = x + size_x
+        y2 = y + size_y
+        for key in self._get_bucket_keys(x, y, size_x, size_y):
+            if key not in self._buckets:
+                continue
+            for other_x1, other_y1, other_x2, other_y2 in self._buckets[key]:
+                if x < other_x2 and other_x1 < x2 and y < other_y2 and other_y1 < y2:
+                    return True
+        return False
 
 
 class Room(object):
@@ -35,57 +89,57 @@ class LayoutGenerator(object):
     TILE_DOOR_CLOSED = '+'
     TILE_DOOR_OPEN = '/'
 
-    def __init__(self, size_x, size_y, max_rooms=100, room_size_x=(7, 12), room_size_y=(7, 12), door_chance=0.75, open_door_chance=0.1):
+    def __init__(self, size_x, size_y, max_rooms=100, room_size_x=(7, 12), room_size_y=(7, 12), door_chance=0.75, open_door_chance=0.1, rng=random):
         self.max_rooms = max_rooms
         self.room_size_x = room_size_x
         self.room_size_y = room_size_y
         self.door_chance = door_chance
         self.open_door_chance = open_door_chance
+        self.rng = rng
         self.grid = TileGrid(size_x, size_y)
         self.rooms = []
+        self._room_index = RectIndex()
+        self._wall_transitions = bytearray(size_x * size_y)
 
     def create_room(self):
-        size_x = random.randint(*self.room_size_x)
-        size_y = random.randint(*self.room_size_y)
-        grid = TileGrid(size_x, size_y)
-
-        for x in xrange(size_x):
-            for y in xrange(size_y):
-                if x == 0 or x == size_x - 1 or y == 0 or y == size_y - 1:
-                    grid[x, y] = self.TILE_WALL
-                else:
-                    grid[x, y] = self.TILE_FLOOR
-
+        size_x = self.rng.randint(*self.room_size_x)
+        size_y = self.rng.randint(*self.room_size_y)
+        grid = TileGrid(size_x, size_y, self.TILE_WALL)
+        grid.fill_rect(1, 1, size_x - 2, size_y - 2, self.TILE_FLOOR)
         return Room(grid)
 
     def place_room(self, room, x, y):
         room.x = x
         room.y = y
         self.rooms.append(room)
-
-        for tile_x in xrange(room.grid.size_x):
-            for tile_y in xrange(room.grid.size_y):
-                tile = room.grid[tile_x, tile_y]
-                if tile == self.TILE_EMPTY:
-                    continue
-                self.grid[x + tile_x, y + tile_y] = tile
+        self._room_index.add(x, y, room.grid.size_x, room.grid.size_y)
+
+        for tile_y in xrange(room.grid.size_y):
+            row = room.grid.get_row(0, tile_y, room.grid.size_x)
+            if self.TILE_EMPTY not in row:
+                # solid row, copy it at once
+                self.grid.set_row(x, y + tile_y, row)
+            else:
+                for tile_x, tile in enumerate(row):
+                    if tile != self.TILE_EMPTY:
+                        self.grid[x + tile_x, y + tile_y] = tile
 
     def choose_gate(self):
-        room = random.choice(self.rooms)
-        dir = random.choice('nsew')
+        room = self.rng.choice(self.rooms)
+        dir = self.rng.choice('nsew')
 
         if dir == 'n':
-            x = randint_triangular(room.x + 1, room.x + room.grid.size_x - 2)
+            x = randint_triangular(room.x + 1, room.x + room.grid.size_x - 2, self.rng)
             y = room.y + room.grid.size_y - 1
         elif dir == 's':
-            x = randint_triangular(room.x + 1, room.x + room.grid.size_x - 2)
+            x = randint_triangular(room.x + 1, room.x + room.grid.size_x - 2, self.rng)
             y = room.y
         elif dir == 'e':
             x = room.x + room.grid.size_x - 1
-            y = randint_triangular(room.y + 1, room.y + room.grid.size_y - 2)
+            y = randint_triangular(room.y + 1, room.y + room.grid.size_y - 2, self.rng)
         elif dir == 'w':
             x = room.x
-            y = randint_triangular(room.y + 1, room.y + room.grid.size_y - 2)
+            y = randint_triangular(room.y + 1, room.y + room.grid.size_y - 2, self.rng)
 
         return x, y, dir
 
@@ -93,19 +147,16 @@ class LayoutGenerator(object):
         if x < 0 or x + room.grid.size_x >= self.grid.size_x or y < 0 or y + room.grid.size_y >= self.grid.size_y:
             return False
 
-        for tile_x in xrange(room.grid.size_x):
-            for tile_y in xrange(room.grid.size_y):
-                if room.grid[tile_x, tile_y] != self.TILE_EMPTY and self.grid[x + tile_x, y + tile_y] != self.TILE_EMPTY:
-                    return False
-
-        return True
+        # every tile is placed as a part of some room (gates are made in
+        # room walls), so it's enough to test room rectangles for overlaps
+        return not self._room_index.intersects(x, y, room.grid.size_x, room.grid.size_y)
 
     def connect_rooms(self, x, y, dir):
         tiles = [self.TILE_FLOOR, self.TILE_FLOOR]
 
-        if random.random() < self.door_chance:
-            tile = random.random() < self.open_door_chance and self.TILE_DOOR_OPEN or self.TILE_DOOR_CLOSED
-            tiles[random.randint(0, 1)] = tile
+        if self.rng.random() < self.door_chance:
+            tile = self.rng.random() < self.open_door_chance and self.TILE_DOOR_OPEN or self.TILE_DOOR_CLOSED
+            tiles[self.rng.randint(0, 1)] = tile
 
         off_x, off_y = {
             'n': (0, 1),
@@ -131,66 +182,88 @@ class LayoutGenerator(object):
             x, y, dir = self.choose_gate()
 
             if dir == 'n':
-                room_x = x - randint_triangular(1, room.grid.size_x - 2)
+                room_x = x - randint_triangular(1, room.grid.size_x - 2, self.rng)
                 room_y = y + 1
             elif dir == 's':
-                room_x = x - randint_triangular(1, room.grid.size_x - 2)
+                room_x = x - randint_triangular(1, room.grid.size_x - 2, self.rng)
                 room_y = y - room.grid.size_y
             elif dir == 'e':
                 room_x = x + 1
-                room_y = y - randint_triangular(1, room.grid.size_y - 1)
+                room_y = y - randint_triangular(1, room.grid.size_y - 1, self.rng)
             elif dir == 'w':
                 room_x = x - room.grid.size_x
-                room_y = y - randint_triangular(1, room.grid.size_y - 1)
+                room_y = y - randint_triangular(1, room.grid.size_y - 1, self.rng)
 
             if self.has_space_for_room(room, room_x, room_y):
                 self.place_room(room, room_x, room_y)
                 self.connect_rooms(x, y, dir)
 
+        self.update_wall_transitions()
+
     def in_bounds(self, x, y):
         return x >= 0 and x < self.grid.size_x and y >= 0 and y < self.grid.size_y
 
+    def set_tile(self, x, y, tile):
+        """Change a tile after generation, keeping wall transitions around it up to date"""
+        self.grid[x, y] = tile
+        x1 = max(0, x - 1)
+        y1 = max(0, y - 1)
+        x2 = min(self.grid.size_x, x + 2)
+        y2 = min(self.grid.size_y, y + 2)
+        self.update_wall_transitions(x1, y1, x2 - x1, y2 - y1)
+
     def get_wall_transition(self, x, y):
-        n = 1
-        e = 2
-        s = 4
-        w = 8
-        nw = 128
-        ne = 16
-        se = 32
-        sw = 64
-
-        def is_wall(x, y):
-            if not self.in_bounds(x, y):
-                return True
-            return self.grid[x, y] in (self.TILE_WALL, self.TILE_EMPTY)
-
-        v = 0
-        if is_wall(x, y + 1):
-            v |= n
-        if is_wall(x + 1, y):
-            v |= e
-        if is_wall(x, y - 1):
-            v |= s
-        if is_wall(x - 1, y):
-            v |= w
-        if is_wall(x - 1, y + 1):
-            v |= nw
-        if is_wall(x + 1, y + 1):
-            v |= ne
-        if is_wall(x - 1, y - 1):
-            v |= sw
-        if is_wall(x + 1, y - 1):
-            v |= se
-
-        return v
+        return self._wall_transitions[y * self.grid.size_x + x]
+
+    def update_wall_transitions(self, x=0, y=0, size_x=None, size_y=None):
+        """
+        Recalculate wall transitions of the given grid region (the whole grid by
+        default). Wall transition is a bitmask telling which of 8 neighbours of
+        a tile are walls (empty tiles and map bounds count as walls too):
+
+            n = 1, e = 2, s = 4, w = 8, ne = 16, se = 32, sw = 64, nw = 128
+
+        Rows are converted into 0/1 wall flags at once, so the inner loop only
+        combines neighbour flags from three rows without any bounds checks.
+        """
+        if size_x is None:
+            size_x = self.grid.size_x
+        if size_y is None:
+            size_y = self.grid.size_y
+
+        transitions = self._wall_transitions
+        below = self._get_wall_flags(x, y - 1, size_x)
+        row = self._get_wall_flags(x, y, size_x)
+        for tile_y in xrange(y, y + size_y):
+            above = self._get_wall_flags(x, tile_y + 1, size_x)
+            start = tile_y * self.grid.size_x + x
+            # wall flags rows are shifted by one, so i + 1 is the tile itself
+            for i in xrange(size_x):
+                transitions[start + i] = (
+                    above[i + 1] | row[i + 2] << 1 | below[i + 1] << 2 | row[i] << 3 |
+                    above[i + 2] << 4 | below[i + 2] << 5 | below[i] << 6 | above[i] << 7
+                )
+            below, row = row, above
+
+    def _get_wall_flags(self, x, y, size_x):
+        """Return wall flags (1 for walls, 0 otherwise) for tiles from x - 1 to x + size_x of row y"""
+        if y < 0 or y >= self.grid.size_y:
+            return bytearray('\x01' * (size_x + 2))
+        x1 = max(0, x - 1)
+        x2 = min(self.grid.size_x, x + size_x + 1)
+        row = self.grid.get_row(x1, y, x2 - x1).translate(_WALL_FLAGS)
+        return bytearray('\x01' * (x1 - x + 1) + row + '\x01' * (x + size_x + 1 - x2))
 
     def print_grid(self):
         for y in xrange(self.grid.size_y):
-            row = ''
-            for x in xrange(self.grid.size_x):
-                row += self.grid[x, y]
-            print row
+            print self.grid.get_row(0, y, self.grid.size_x)
+
+
+# translation table to convert tile rows into wall flags
+_WALL_FLAGS = ''.join(
+    '\x01' if chr(i) in (LayoutGenerator.TILE_WALL, LayoutGenerator.TILE_EMPTY) else '\x00'
+    for i in xrange(256)
+)
 
 
 if __name__ == '__main__':
@@ -5,14 +5,19 @@ class Health(Component):
 
     COMPONENT_NAME = 'health'
 
+    __slots__ = ('health', 'max_health')
+
     def __init__(self, max_health):
         self.health = self.max_health = max_health
 
     def on_take_damage(self, amount, source):
         self.health -= amount
         self.owner.event('health_update')
+
+    def check_death(self, killer=None):
+        """Die if out of health. Called after the damage event is handled by everyone"""
         if self.health <= 0:
-            self.die(source)
+            self.die(killer)
 
     def die(self, killer=None):
         self.owner.event('die')
@@ -1,3 +1,5 @@
+import collections
+
 import pyglet
 
 from description import get_name
@@ -8,11 +10,24 @@ from item import Item
 
 
 class HUD(object):
+    """
+    Player stats line. HP, ATK/DEF and inventory are separate labels laid
+    out one after another, so e.g. taking a hit only re-lays out the HP
+    label and shifts the others. Inventory summary is cached per item
+    stack and updated only for stacks that change.
+    """
 
     def __init__(self, batch, group=None):
-        self._label = pyglet.text.Label(font_name='eight2empire', anchor_y='bottom', batch=batch, group=group)
+        self._hp_label = self._create_label(batch, group)
+        self._stats_label = self._create_label(batch, group)
+        self._inventory_label = self._create_label(batch, group)
+        self._item_names = collections.OrderedDict()
         self._player = None
 
+    @staticmethod
+    def _create_label(batch, group):
+        return pyglet.text.Label(font_name='eight2empire', anchor_y='bottom', batch=batch, group=group)
+
     @property
     def player(self):
         return self._player
@@ -21,31 +36,70 @@ class HUD(object):
     def player(self, value):
         if value is not self._player:
             if self._player is not None:
-                self._player.unlisten('health_update', self._update_hud)
-                self._player.unlisten('pickup', self._update_hud)
-                self._player.unlisten('drop', self._update_hud)
+                self._player.unlisten('health_update', self._on_health_update)
+                self._player.unlisten('inventory_update', self._on_inventory_update)
+                self._player.unlisten('inventory_remove', self._on_inventory_remove)
 
             self._player = value
+            self._item_names.clear()
             if value is not None:
-                value.listen('health_update', self._update_hud)
-                value.listen('pickup', self._update_hud)
-                value.listen('drop', self._update_hud)
-                self._update_hud()
+                value.listen('health_update', self._on_health_update)
+                value.listen('inventory_update', self._on_inventory_update)
+                value.listen('inventory_remove', self._on_inventory_remove)
+                self._update_all()
 
-    def _update_hud(self, *args):
-        item_names = []
+    def _update_all(self):
         for item in self._player.get(Inventory).items:
-            name = get_name(item)
-            item_component = item.get(Item)
-            if item_component.quantity > 1:
-                name += ' (%d)' % item_component.quantity
-            item_names.append(name)
-        inventory = ', '.join(item_names) or 'nothing'
+            self._item_names[item] = self._get_item_name(item)
         fighter = self._player.get(Fighter)
+        self._set_text(self._stats_label, ', ATK: %d, DEF: %d' % (fighter.attack, fighter.defense))
+        self._update_health()
+        self._update_inventory()
+        self._update_positions()
+
+    def _on_health_update(self, player):
+        self._update_health()
+
+    def _on_inventory_update(self, player, items):
+        for item in items:
+            self._item_names[item] = self._get_item_name(item)
+        self._update_inventory()
+
+    def _on_inventory_remove(self, player, item):
+        del self._item_names[item]
+        self._update_inventory()
+
+    def _update_health(self):
         health = self._player.get(Health)
-        text = 'HP: %d/%d, ATK: %d, DEF: %d (INV: %s)' % (health.health, health.max_health, fighter.attack, fighter.defense, inventory)
-        self._label.text = text
+        if self._set_text(self._hp_label, 'HP: %d/%d' % (health.health, health.max_health)):
+            self._update_positions()
+
+    def _update_inventory(self):
+        inventory = ', '.join(self._item_names.itervalues()) or 'nothing'
+        self._set_text(self._inventory_label, ' (INV: %s)' % inventory)
+
+    def _update_positions(self):
+        # moving a label only translates its vertices, no re-layout needed
+        self._stats_label.x = self._hp_label.x + self._hp_label.content_width
+        self._inventory_label.x = self._stats_label.x + self._stats_label.content_width
+
+    @staticmethod
+    def _set_text(label, text):
+        if label.text != text:
+            label.text = text
+            return True
+        return False
+
+    @staticmethod
+    def _get_item_name(item):
+        name = get_name(item)
+        item_component = item.get(Item)
+        if item_component.quantity > 1:
+            name += ' (%d)' % item_component.quantity
+        return name
 
     def delete(self):
         self.player = None
-        self._label.delete()
+        self._hp_label.delete()
+        self._stats_label.delete()
+        self._inventory_label.delete()
@@ -1,22 +1,69 @@
+from collections import OrderedDict
+
 from entity import Component
 from item import Item
 
 
 class Inventory(Component):
+    """
+    Item entities in pickup order. Stackable items are indexed by their
+    type_name, so finding a stack to merge into, adding and removing items
+    are all O(1).
+
+    Fires 'inventory_update' with the list of stacks that were added or
+    grown, and 'inventory_remove' with the item that was removed.
+    """
 
     COMPONENT_NAME = 'inventory'
 
+    __slots__ = ('_items', '_stacks')
+
     def __init__(self):
-        self.items = []
+        self._items = OrderedDict() # used as ordered set
+        self._stacks = {} # stackable item type_name -> item entity
+
+    @property
+    def items(self):
+        return self._items.keys()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def get_last(self):
+        if self._items:
+            return next(reversed(self._items))
+        return None
 
     def pickup(self, item):
+        self.pickup_all([item])
+
+    def pickup_all(self, items):
+        updated = OrderedDict()
+        for item in items:
+            stack = self._add(item)
+            updated[stack] = None
+        if updated:
+            self.owner.event('inventory_update', updated.keys())
+
+    def _add(self, item):
         item_component = item.get(Item)
 
         if item_component.stackable:
-            for other in self.items:
-                other_item_component = other.get(Item)
-                if other_item_component.stacks_with(item_component):
-                    other_item_component.quantity += item_component.quantity
-                    return
+            stack = self._stacks.get(item_component.type_name)
+            if stack is not None:
+                stack.get(Item).quantity += item_component.quantity
+                return stack
+            self._stacks[item_component.type_name] = item
+
+        self._items[item] = None
+        return item
 
-        self.items.append(item)
+    def remove(self, item):
+        del self._items[item]
+        type_name = item.get(Item).type_name
+        if self._stacks.get(type_name) is item:
+            del self._stacks[type_name]
+        self.owner.event('inventory_remove', item)
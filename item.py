@@ -5,13 +5,9 @@ class Item(Component):
 
     COMPONENT_NAME = 'item'
 
+    __slots__ = ('type_name', 'stackable', 'quantity')
+
     def __init__(self, type_name, stackable=True, quantity=1):
         self.type_name = type_name
         self.stackable = stackable
         self.quantity = quantity
-
-    def stacks_with(self, other_item):
-        if self.stackable and other_item.type_name == self.type_name:
-            return True
-        else:
-            return False
@@ -1,20 +1,23 @@
-import random
+import pyglet
 
 from actor import Actor, ActorSystem
 from blocker import Blocker
 from description import Description
 from door import create_door
-from entity import Entity
-from fov import FOV
+from entity import ComponentStore, Entity
+from fov import FOV, InFOV
 from generator import LayoutGenerator
 from health import Health
 from item import Item
+from light import LightSource, LightSystem
 from message import MessageLogger
 from monster import create_random_monster
 from player import create_player
 from position import Position, PositionSystem
-from render import Renderable, LayoutRenderable, RenderSystem
+from renderable import Renderable
 from temp import light_anim, fountain_anim, library_texes, gold_texes
+from terrain import Terrain
+from util import RandomStreams
 
 
 class BOUNDS(object):
@@ -25,26 +28,38 @@ class BOUNDS(object):
 BOUNDS = BOUNDS()
 
 
-class Level(object):
+class Level(pyglet.event.EventDispatcher):
+    """
+    Level simulation. It doesn't know anything about rendering, so it can
+    run headless. Observers (like the RenderSystem) attach to it with
+    push_handlers and get notified about entity and light changes.
 
-    def __init__(self, game, size_x, size_y):
+    All randomness comes from the level's RandomStreams, so levels created
+    with the same seed and played with the same commands are identical.
+    """
+
+    def __init__(self, game, size_x, size_y, seed=None):
         self.game = game
+        self.rng = RandomStreams(seed)
         self.actor_system = ActorSystem(self)
         self.position_system = PositionSystem()
-        self.render_system = RenderSystem(self)
         self.size_x = size_x
         self.size_y = size_y
 
-        self._entities = set()
+        self.components = ComponentStore()
+
+        # number of sight/movement blocking entities in every cell,
+        # so blocking checks don't need to look at entities at all
+        self.sight_blockers = bytearray(size_x * size_y)
+        self.movement_blockers = bytearray(size_x * size_y)
+        self.light_system = LightSystem(self)
 
         self._generate_level()
 
-        self.render_system.render_level()
-        self.render_system.update_player()
         self.player.get(FOV).update_light()
 
     def _generate_level(self):
-        self._layout = LayoutGenerator(self.size_x, self.size_y, max_rooms=30)
+        self._layout = LayoutGenerator(self.size_x, self.size_y, max_rooms=30, rng=self.rng.layout)
         self._layout.generate()
         self._process_layout()
         self._add_features()
@@ -53,33 +68,38 @@ class Level(object):
         self._add_player()
 
     def _process_layout(self):
+        # floor and walls are kept in the terrain grid, only doors are entities
+        self.terrain = Terrain(self._layout.grid)
+        walls = self.terrain.get_blocking_map()
+        self.sight_blockers[:] = walls
+        self.movement_blockers[:] = walls
+
         grid = self._layout.grid
-        for x in xrange(grid.size_x):
-            for y in xrange(grid.size_y):
-                tile = grid[x, y]
+        for y in xrange(grid.size_y):
+            row = grid.get_row(0, y, grid.size_x)
+            if LayoutGenerator.TILE_DOOR_CLOSED not in row and LayoutGenerator.TILE_DOOR_OPEN not in row:
+                continue
+            for x, tile in enumerate(row):
                 if tile in (LayoutGenerator.TILE_DOOR_CLOSED, LayoutGenerator.TILE_DOOR_OPEN):
                     self.add_entity(create_door(x, y, tile == LayoutGenerator.TILE_DOOR_OPEN))
-                    self.add_entity(Entity(Description('Floor'), LayoutRenderable(tile), Position(x, y)))
-                elif tile == LayoutGenerator.TILE_WALL:
-                    self.add_entity(Entity(Description('Wall'), Blocker(True, True), LayoutRenderable(tile), Position(x, y, Position.ORDER_WALLS)))
-                elif tile == LayoutGenerator.TILE_FLOOR:
-                    self.add_entity(Entity(Description('Floor'), LayoutRenderable(tile), Position(x, y)))
 
     def _add_features(self):
         # TODO: factor this out into feature generator
+        rng = self.rng.population
         for room in self._layout.rooms:
-            feature = random.choice([None, 'light', 'fountain', 'library'])
+            feature = rng.choice([None, 'light', 'fountain', 'library'])
             if feature == 'light':
-                coords = random.sample([
+                coords = rng.sample([
                     (room.x + 1, room.y + 1),
                     (room.x + room.grid.size_x - 2, room.y + 1),
                     (room.x + 1, room.y + room.grid.size_y - 2),
                     (room.x + room.grid.size_x - 2, room.y + room.grid.size_y - 2),
-                ], random.randint(1, 4))
+                ], rng.randint(1, 4))
                 for x, y in coords:
                     self.add_entity(Entity(
                         Renderable(light_anim, memorable=True),
                         Blocker(blocks_movement=True),
+                        LightSource(5),
                         Description('Light'),
                         Position(x, y, Position.ORDER_FEATURES)
                     ))
@@ -87,6 +107,7 @@ class Level(object):
                 self.add_entity(Entity(
                     Renderable(fountain_anim, memorable=True),
                     Blocker(blocks_movement=True),
+                    LightSource(3),
                     Description('Fountain'),
                     Position(room.x + room.grid.size_x / 2, room.y + room.grid.size_y / 2, Position.ORDER_FEATURES)
                 ))
@@ -100,69 +121,104 @@ class Level(object):
                     if x == room.x + room.grid.size_x - 2 and self._layout.grid[x + 1, y - 1] != LayoutGenerator.TILE_WALL:
                         continue
                     self.add_entity(Entity(
-                        Renderable(random.choice(library_texes), memorable=True),
+                        Renderable(rng.choice(library_texes), memorable=True),
                         Blocker(blocks_movement=True),
                         Description('Bookshelf'),
                         Position(x, y - 1, Position.ORDER_FEATURES)
                     ))
 
     def _add_monsters(self):
+        rng = self.rng.population
         for room in self._layout.rooms:
-            for i in xrange(random.randint(0, 3)):
-                x = random.randrange(room.x + 1, room.x + room.grid.size_x - 1)
-                y = random.randrange(room.y + 1, room.y + room.grid.size_y - 1)
-                if not self.get_movement_blocker(x, y):
-                    self.add_entity(create_random_monster(x, y))
+            for i in xrange(rng.randint(0, 3)):
+                x = rng.randrange(room.x + 1, room.x + room.grid.size_x - 1)
+                y = rng.randrange(room.y + 1, room.y + room.grid.size_y - 1)
+                if not self.is_movement_blocked(x, y):
+                    self.add_entity(create_random_monster(x, y, rng))
 
     def _add_items(self):
+        rng = self.rng.population
         for room in self._layout.rooms:
-            if random.random() > 0.3:
+            if rng.random() > 0.3:
                 continue
-            x = random.randrange(room.x + 1, room.x + room.grid.size_x - 1)
-            y = random.randrange(room.y + 1, room.y + room.grid.size_y - 1)
-            if not self.get_movement_blocker(x, y):
+            x = rng.randrange(room.x + 1, room.x + room.grid.size_x - 1)
+            y = rng.randrange(room.y + 1, room.y + room.grid.size_y - 1)
+            if not self.is_movement_blocked(x, y):
                 self.add_entity(Entity(
                     Description('Gold'),
-                    Renderable(random.choice(gold_texes)),
+                    Renderable(rng.choice(gold_texes)),
                     Position(x, y, order=Position.ORDER_ITEMS),
-                    Item('gold', quantity=random.randint(1, 50)),
+                    Item('gold', quantity=rng.randint(1, 50)),
                 ))
 
     def _add_player(self):
-        room = random.choice(self._layout.rooms) # TODO: refactor this to stairs up/down
+        room = self.rng.population.choice(self._layout.rooms) # TODO: refactor this to stairs up/down
         self.player = create_player(room.x + room.grid.size_x / 2, room.y + room.grid.size_y / 2)
         self.player.add(MessageLogger(self.game.message_log))
         self.player.listen('fov_updated', self._on_player_fov_update)
         self.add_entity(self.player)
 
-    def _on_player_fov_update(self, player, old_lightmap, new_lightmap):
-        self.render_system.update_light(old_lightmap, new_lightmap)
+    def _on_player_fov_update(self, player, lit, darkened, changed):
+        # update in_fov flags of entities in cells that became lit or dark
+        for keys, in_fov in ((lit, True), (darkened, False)):
+            for key in keys:
+                for entity in self.position_system.get_entities_at(*key):
+                    infov = entity.get(InFOV)
+                    if infov:
+                        infov.in_fov = in_fov
+
+        self.dispatch_event('on_light_update', lit, darkened, changed)
+
+    def is_sight_blocked(self, x, y):
+        if x < 0 or x >= self.size_x or y < 0 or y >= self.size_y:
+            return True
+        return self.sight_blockers[y * self.size_x + x] > 0
+
+    def is_movement_blocked(self, x, y):
+        if x < 0 or x >= self.size_x or y < 0 or y >= self.size_y:
+            return True
+        return self.movement_blockers[y * self.size_x + x] > 0
 
     def get_sight_blocker(self, x, y):
         if not self._layout.in_bounds(x, y):
             return BOUNDS
 
+        if not self.sight_blockers[y * self.size_x + x]:
+            return None
+
         for entity in self.position_system.get_entities_at(x, y):
             blocker = entity.get(Blocker)
             if blocker and blocker.blocks_sight:
                 return blocker
 
+        if self.terrain.is_wall(x, y):
+            return self.terrain.get_entity(x, y).get(Blocker)
+
         return None
 
     def get_movement_blocker(self, x, y):
         if not self._layout.in_bounds(x, y):
             return BOUNDS
 
+        if not self.movement_blockers[y * self.size_x + x]:
+            return None
+
         for entity in self.position_system.get_entities_at(x, y):
             blocker = entity.get(Blocker)
             if blocker and blocker.blocks_movement:
                 return blocker
 
+        if self.terrain.is_wall(x, y):
+            return self.terrain.get_entity(x, y).get(Blocker)
+
         return None
 
+    def get_entities(self):
+        return tuple(self.components)
+
     def add_entity(self, entity):
         entity.level = self
-        self._entities.add(entity)
+        self.components.add_entity(entity)
 
         if entity.has(Position):
             self.position_system.add_entity(entity)
@@ -171,17 +227,23 @@ class Level(object):
                 entity.listen('take_damage', self._on_take_damage)
 
             if entity.has(Blocker):
+                pos = entity.get(Position)
+                self._update_blocker_maps(entity, pos.x, pos.y, 1)
                 entity.listen('blocks_sight_change', self._on_blocks_sight_change)
+                entity.listen('blocks_movement_change', self._on_blocks_movement_change)
+                entity.listen('move', self._on_blocker_move)
 
-            if entity.has(Renderable):
-                self.render_system.add_entity(entity)
+            if entity.has(LightSource):
+                self.light_system.add_entity(entity)
 
         if entity.has(Actor):
             self.actor_system.add_entity(entity)
 
+        self.dispatch_event('on_entity_add', entity)
+
 
     def remove_entity(self, entity):
-        self._entities.remove(entity)
+        self.components.remove_entity(entity)
         entity.level = None
 
         if entity.has(Position):
@@ -191,27 +253,62 @@ class Level(object):
                 entity.unlisten('take_damage', self._on_take_damage)
 
             if entity.has(Blocker):
+                pos = entity.get(Position)
+                self._update_blocker_maps(entity, pos.x, pos.y, -1)
                 entity.unlisten('blocks_sight_change', self._on_blocks_sight_change)
+                entity.unlisten('blocks_movement_change', self._on_blocks_movement_change)
+                entity.unlisten('move', self._on_blocker_move)
 
-            if entity.has(Renderable):
-                self.render_system.remove_entity(entity)
+            if entity.has(LightSource):
+                self.light_system.remove_entity(entity)
 
         if entity.has(Actor):
             self.actor_system.remove_entity(entity)
 
+        self.dispatch_event('on_entity_remove', entity)
+
 
     def _on_take_damage(self, entity, amount, source):
+        self.dispatch_event('on_take_damage', entity, amount, source)
+
+    def _update_blocker_maps(self, entity, x, y, delta):
+        blocker = entity.get(Blocker)
+        if blocker.blocks_sight:
+            self._change_sight_blockers(x, y, delta)
+        if blocker.blocks_movement:
+            self.movement_blockers[y * self.size_x + x] += delta
+
+    def _change_sight_blockers(self, x, y, delta):
+        idx = y * self.size_x + x
+        was_blocked = self.sight_blockers[idx] > 0
+        self.sight_blockers[idx] += delta
+        if (self.sight_blockers[idx] > 0) != was_blocked:
+            self.light_system.update_cell(x, y)
+
+    def _on_blocker_move(self, entity, old_x, old_y, new_x, new_y):
+        self._update_blocker_maps(entity, old_x, old_y, -1)
+        self._update_blocker_maps(entity, new_x, new_y, 1)
+
+    def _on_blocks_movement_change(self, entity):
         pos = entity.get(Position)
-        self.render_system.animate_damage(pos.x, pos.y, amount)
+        self.movement_blockers[pos.y * self.size_x + pos.x] += 1 if entity.get(Blocker).blocks_movement else -1
 
     def _on_blocks_sight_change(self, entity):
         pos = entity.get(Position)
+        self._change_sight_blockers(pos.x, pos.y, 1 if entity.get(Blocker).blocks_sight else -1)
+
         fov = self.player.get(FOV)
         if fov.is_in_fov(pos.x, pos.y):
-            fov.update_light()
+            fov.update_cell(pos.x, pos.y)
 
     def tick(self):
         self.actor_system.update()
 
     def get_wall_transition(self, x, y):
         return self._layout.get_wall_transition(x, y)
+
+Level.register_event_type('on_entity_add')
+Level.register_event_type('on_entity_remove')
+Level.register_event_type('on_take_damage')
+Level.register_event_type('on_light_update')
+Level.register_event_type('on_ambient_light_update')
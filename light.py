@@ -1,50 +1,155 @@
+from array import array
+
 import pyglet
 
+from entity import Component
+from position import Position
+from shadowcaster import GridShadowCaster
+
+
+class LightSource(Component):
+
+    COMPONENT_NAME = 'light_source'
+
+    __slots__ = ('radius',)
+
+    def __init__(self, radius):
+        self.radius = radius
+
+
+class LightSystem(object):
+    """
+    Level light produced by LightSource entities. Lightmap of every source is
+    calculated once with the shadowcaster and cached, and all of them are
+    summed up in the light buffer (indexed by y * size_x + x). A source is
+    only recast when sight blocking changes in a cell within its radius.
+    """
+
+    def __init__(self, level):
+        self._level = level
+        self._caster = GridShadowCaster(level.size_x, level.size_y, level.sight_blockers)
+        self._lightmaps = {}
+        self.light = array('d', [0.0]) * (level.size_x * level.size_y)
+
+    def add_entity(self, entity):
+        self._notify(self._cast(entity))
+        entity.listen('move', self._on_move)
+
+    def remove_entity(self, entity):
+        self._notify(self._uncast(entity))
+        entity.unlisten('move', self._on_move)
+
+    def get_light(self, x, y):
+        return self.light[y * self._level.size_x + x]
+
+    def update_cell(self, x, y):
+        """Recast sources that can reach the cell which changed its sight blocking state"""
+        changed = set()
+        for entity in self._lightmaps.keys():
+            pos = entity.get(Position)
+            radius = entity.get(LightSource).radius
+            if abs(pos.x - x) <= radius and abs(pos.y - y) <= radius:
+                changed.update(self._uncast(entity))
+                changed.update(self._cast(entity))
+        self._notify(changed)
+
+    def _cast(self, entity):
+        pos = entity.get(Position)
+        self._caster.calculate_light(pos.x, pos.y, entity.get(LightSource).radius)
+        intensity = self._caster.intensity
+        lightmap = [(idx, intensity[idx]) for idx in self._caster.lit]
+
+        light = self.light
+        for idx, value in lightmap:
+            light[idx] += value
+        self._lightmaps[entity] = lightmap
+        return [idx for idx, value in lightmap]
+
+    def _uncast(self, entity):
+        light = self.light
+        lightmap = self._lightmaps.pop(entity)
+        for idx, value in lightmap:
+            light[idx] -= value
+        return [idx for idx, value in lightmap]
+
+    def _notify(self, changed):
+        if changed:
+            size_x = self._level.size_x
+            self._level.dispatch_event('on_ambient_light_update', [(idx % size_x, idx // size_x) for idx in changed])
+
+    def _on_move(self, entity, old_x, old_y, new_x, new_y):
+        self._notify(set(self._uncast(entity) + self._cast(entity)))
+
 
 class LightOverlay(object):
+    """
+    Darkening overlay over the level, split into chunks which are registered
+    in the given render.ChunkCuller, so only chunks seen by camera are drawn.
+    """
 
-    def __init__(self, size_x, size_y, batch, group):
+    def __init__(self, size_x, size_y, culler, group):
         self.size_x = size_x
         self.size_y = size_y
+        self.chunk_size = culler.chunk_size
+        self._vlists = {}
+
+        for chunk_x in xrange(0, self.size_x, self.chunk_size):
+            for chunk_y in xrange(0, self.size_y, self.chunk_size):
+                vertices = []
+                colors = []
+
+                chunk_size_x = min(self.chunk_size, self.size_x - chunk_x)
+                chunk_size_y = min(self.chunk_size, self.size_y - chunk_y)
+                for tile_y in xrange(chunk_y, chunk_y + chunk_size_y):
+                    for tile_x in xrange(chunk_x, chunk_x + chunk_size_x):
+                        x1 = tile_x * 8
+                        x2 = (tile_x + 1) * 8
+                        y1 = tile_y * 8
+                        y2 = (tile_y + 1) * 8
+                        c = (0, 0, 0, 255)
+                        vertices.extend((x1, y1, x2, y1, x2, y2, x1, y2))
+                        colors.extend((c * 4))
+
+                vlist = culler.hidden_batch.add(chunk_size_x * chunk_size_y * 4, pyglet.gl.GL_QUADS, group,
+                    ('v2i', vertices),
+                    ('c4B', colors)
+                )
+                key = culler.get_chunk_key(chunk_x, chunk_y)
+                self._vlists[key] = vlist, chunk_size_x
+                culler.add(key, vlist, pyglet.gl.GL_QUADS, group)
+
+    def update_light(self, keys, lightmap, memory, ambient):
+        """Update overlay colors of the given tiles, leaving all other tiles untouched"""
+        size_x = self.size_x
+        chunk_size = self.chunk_size
+        chunk_colors = {}
+
+        for key in keys:
+            tile_x, tile_y = key
+            intensity = lightmap.get(key)
 
-        vertices = []
-        colors = []
-
-        for tile_y in xrange(self.size_y):
-            for tile_x in xrange(self.size_x):
-                x1 = tile_x * 8
-                x2 = (tile_x + 1) * 8
-                y1 = tile_y * 8
-                y2 = (tile_y + 1) * 8
-                c = (0, 0, 0, 255)
-                vertices.extend((x1, y1, x2, y1, x2, y2, x1, y2))
-                colors.extend((c * 4))
-
-        self._vlist = batch.add(self.size_x * self.size_y * 4, pyglet.gl.GL_QUADS, group,
-            ('v2i', vertices),
-            ('c4B', colors)
-        )
-
-    def update_light(self, lightmap, memory):
-        colors = []
-
-        for tile_y in xrange(self.size_y):
-            for tile_x in xrange(self.size_x):
-                key = tile_x, tile_y
-                intensity = lightmap.get(key)
-
-                if intensity is None and key not in memory:
-                    # if tile is not lit and not in memory, overlay it with opaque black
-                    v = 255
+            if intensity is None and key not in memory:
+                # if tile is not lit and not in memory, overlay it with opaque black
+                v = 255
+            else:
+                # else calculate opacity based on light intensity, adding level light to visible tiles
+                if intensity is None:
+                    intensity = 0
                 else:
-                    # else calculate opacity based on light intensity
-                    intensity = intensity or 0
-                    v = int((1 - (0.3 + intensity * 0.7)) * 255)
+                    intensity = min(1.0, intensity + ambient[tile_y * size_x + tile_x])
+                v = int((1 - (0.3 + intensity * 0.7)) * 255)
 
-                c = (0, 0, 0, v)
-                colors.extend((c * 4))
+            chunk_key = tile_x // chunk_size, tile_y // chunk_size
+            if chunk_key not in chunk_colors:
+                vlist, chunk_size_x = self._vlists[chunk_key]
+                chunk_colors[chunk_key] = vlist.colors, chunk_size_x
+            colors, chunk_size_x = chunk_colors[chunk_key]
 
-        self._vlist.colors = colors
+            # every tile is a quad of 4 vertices with 4 color components each
+            idx = ((tile_y % chunk_size) * chunk_size_x + tile_x % chunk_size) * 16
+            colors[idx:idx + 16] = (0, 0, 0, v) * 4
 
     def delete(self):
-        self._vlist.delete()
+        for vlist, chunk_size_x in self._vlists.values():
+            vlist.delete()
+        self._vlists.clear()
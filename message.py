@@ -1,59 +1,143 @@
+import collections
+import gzip
+
 import pyglet
 
 from description import get_name
 from entity import Component
-from item import Item
 
 
 class MessageLog(pyglet.event.EventDispatcher):
+    """
+    Log of game messages. Only max_messages latest messages are kept in
+    memory. If archive_path is given, all messages are also appended to
+    a gzip-compressed text file there, one per line.
+
+    Messages are numbered in order of adding, and unseen ones are tracked
+    with a watermark: number of the first message not marked as seen.
+    """
 
-    def __init__(self, num_latest=5):
+    def __init__(self, num_latest=5, max_messages=100, archive_path=None):
         self.num_latest = num_latest
-        self.messages = []
-        self.new_message_indexes = []
+        self.messages = collections.deque(maxlen=max_messages)
+        self.total = 0
+        self._seen_watermark = 0
+        self._archive = gzip.open(archive_path, 'ab') if archive_path else None
 
     def get_latest(self):
         result = []
-        total = len(self.messages)
-        for i in xrange(max(0, total - self.num_latest), total):
-            result.append((self.messages[i], i in self.new_message_indexes))
+        count = len(self.messages)
+        first_number = self.total - count
+        for i in xrange(max(0, count - self.num_latest), count):
+            result.append((self.messages[i], first_number + i >= self._seen_watermark))
         return result
 
     def add_message(self, text):
-        idx = len(self.messages)
         self.messages.append(text)
-        self.new_message_indexes.append(idx)
+        self.total += 1
+        if self._archive:
+            self._archive.write(text + '\n')
         self.dispatch_event('on_messages_update')
 
     def mark_as_seen(self):
-        if self.new_message_indexes:
-            self.new_message_indexes[:] = []
+        if self._seen_watermark < self.total:
+            self._seen_watermark = self.total
             self.dispatch_event('on_messages_update')
 
+    def close(self):
+        if self._archive:
+            self._archive.close()
+            self._archive = None
+
 MessageLog.register_event_type('on_messages_update')
 
 
 class LastMessagesView(object):
+    """
+    Shows latest messages from the log. Updates are coalesced: the view
+    only gets marked dirty on log changes and is refreshed at most once
+    per frame. The document is kept between refreshes and only changed
+    lines are inserted, deleted or restyled in it.
+    """
+
+    FONT_NAME = 'eight2empire'
+    MARKER = '>>'
 
     def __init__(self, message_log, width, y, batch, group=None):
         self.message_log = message_log
         self.message_log.set_handler('on_messages_update', self.on_messages_update)
-        self.layout = pyglet.text.layout.TextLayout(self.prepare_document(), width=width, multiline=True, batch=batch, group=group)
+        self.document = pyglet.text.document.FormattedDocument()
+        self._lines = [] # [length, marker_length, new] for every line in the document
+        self._shown_total = 0
+        self._dirty = False
+        self.layout = pyglet.text.layout.TextLayout(self.document, width=width, multiline=True, batch=batch, group=group)
         self.layout.anchor_y = 'top'
         self.layout.y = y
+        self.refresh()
 
     def on_messages_update(self):
-        self.layout.document = self.prepare_document()
-
-    def prepare_document(self):
-        parts = ['{font_name "eight2empire"}']
-        for text, new in self.message_log.get_latest():
-            parts.append('{color (255, 255, 0, %d)}>>' % (new and 255 or 0))
-            parts.append(text)
-            parts.append('{}\n')
-        return pyglet.text.decode_attributed(''.join(parts))
+        if not self._dirty:
+            self._dirty = True
+            pyglet.clock.schedule_once(self.refresh, 0)
+
+    def refresh(self, dt=None):
+        if self._dirty:
+            self._dirty = False
+            pyglet.clock.unschedule(self.refresh)
+
+        latest = self.message_log.get_latest()
+        added = min(self.message_log.total - self._shown_total, len(latest))
+        self._shown_total = self.message_log.total
+
+        self.layout.begin_update()
+
+        # drop lines that scrolled out
+        num_removed = len(self._lines) + added - len(latest)
+        if num_removed > 0:
+            end = sum(line[0] for line in self._lines[:num_removed])
+            self.document.delete_text(0, end)
+            del self._lines[:num_removed]
+
+        # update markers of lines that are kept
+        pos = 0
+        for line, (text, new) in zip(self._lines, latest):
+            if line[2] != new:
+                line[2] = new
+                self.document.set_style(pos, pos + line[1], {'color': self._get_marker_color(new)})
+            pos += line[0]
+
+        # append new lines
+        for text, new in latest[len(latest) - added:]:
+            length, marker_length = self._insert_line(pos, text, new)
+            self._lines.append([length, marker_length, new])
+            pos += length
+
+        self.layout.end_update()
+
+    def _insert_line(self, pos, text, new):
+        # message text without own color is shown in marker color,
+        # so it has to be restyled along with the marker
+        marker_color = self._get_marker_color(new)
+        start = pos
+        self.document.insert_text(pos, self.MARKER, {'font_name': self.FONT_NAME, 'color': marker_color})
+        pos += len(self.MARKER)
+        marker_length = len(self.MARKER)
+        message = pyglet.text.decode_attributed(text)
+        for run_start, run_end, color in message.get_style_runs('color').ranges(0, len(message.text)):
+            if color is None:
+                color = marker_color
+                marker_length += run_end - run_start
+            self.document.insert_text(pos, message.text[run_start:run_end], {'font_name': self.FONT_NAME, 'color': color})
+            pos += run_end - run_start
+        self.document.insert_text(pos, '\n', {'font_name': self.FONT_NAME})
+        return pos + 1 - start, marker_length
+
+    def _get_marker_color(self, new):
+        return (255, 255, 0, new and 255 or 0)
 
     def delete(self):
+        if self._dirty:
+            pyglet.clock.unschedule(self.refresh)
         self.message_log.remove_handler('on_messages_update', self.on_messages_update)
         self.layout.delete()
 
@@ -62,6 +146,8 @@ class MessageLogger(Component):
 
     COMPONENT_NAME = 'message_logger'
 
+    __slots__ = ('_message_log',)
+
     def __init__(self, message_log):
         self._message_log = message_log
 
@@ -91,9 +177,13 @@ class MessageLogger(Component):
         else:
             self.message('Nothing to drop')
 
-    def on_pickup(self, item):
-        if item:
-            self.message('Picked up %d %s' % (item.get(Item).quantity, get_name(item)))
+    def on_pickup(self, picked):
+        if picked:
+            quantities = collections.OrderedDict()
+            for item, quantity in picked:
+                name = get_name(item)
+                quantities[name] = quantities.get(name, 0) + quantity
+            self.message('Picked up %s' % ', '.join('%d %s' % (quantity, name) for name, quantity in quantities.iteritems()))
         else:
             self.message('Nothing to pickup here')
 
@@ -10,13 +10,13 @@ from fov import InFOV
 from health import Health
 from player import is_player
 from position import Position, Movement
-from render import Renderable
+from renderable import Renderable
 from temp import get_random_monster_params, corpse_texes
 from util import calc_distance
 
 
-def create_random_monster(x, y):
-    name, tex = get_random_monster_params()
+def create_random_monster(x, y, rng=random):
+    name, tex = get_random_monster_params(rng)
     monster = Entity(
         Actor(80, monster_act),
         Position(x, y, Position.ORDER_CREATURES),
@@ -55,10 +55,12 @@ def monster_bump(blocker, who):
 
 class CorpseGenerator(Component):
 
+    __slots__ = ()
+
     def on_die(self):
         pos = self.owner.get(Position)
         corpse = Entity(
-            Renderable(random.choice(corpse_texes)),
+            Renderable(self.owner.level.rng.combat.choice(corpse_texes)),
             Description('%s\'s corpse' % get_name(self.owner)),
             Position(pos.x, pos.y, Position.ORDER_FLOOR + 1),
         )
@@ -8,7 +8,7 @@ from health import Health
 from inventory import Inventory
 from command import Command
 from position import Position, Movement
-from render import Renderable
+from renderable import Renderable
 from temp import player_tex
 
 
@@ -16,6 +16,8 @@ class Player(Component):
 
     COMPONENT_NAME = 'player'
 
+    __slots__ = ()
+
 
 def is_player(entity):
     return entity.has(Player)
@@ -1,4 +1,3 @@
-from bisect import insort_right
 from collections import defaultdict
 
 from entity import Component
@@ -9,6 +8,8 @@ class Position(Component):
 
     COMPONENT_NAME = 'position'
 
+    __slots__ = ('_x', '_y', '_order')
+
     ORDER_FLOOR = 0
     ORDER_WALLS = 10
     ORDER_FEATURES = 20
@@ -37,6 +38,8 @@ class Movement(Component):
 
     COMPONENT_NAME = 'movement'
 
+    __slots__ = ()
+
     def move(self, dx, dy):
         pos = self.owner.get(Position)
         new_x = pos.x + dx
@@ -49,6 +52,16 @@ class Movement(Component):
             blocker.bump_function(blocker, self.owner)
 
 
+def _insort_by_order(entities, order, entity):
+    # like bisect.insort_right on (order, entity) pairs, but entities with the
+    # same order are never compared, as that would order them by memory address
+    # and break determinism of seeded levels
+    i = len(entities)
+    while i and entities[i - 1][0] > order:
+        i -= 1
+    entities.insert(i, (order, entity))
+
+
 class PositionSystem(object):
 
     def __init__(self):
@@ -57,7 +70,7 @@ class PositionSystem(object):
     def add_entity(self, entity):
         entity.listen('move', self._on_move)
         position = entity.get(Position)
-        insort_right(self._positions[position.x, position.y], (position.order, entity))
+        _insort_by_order(self._positions[position.x, position.y], position.order, entity)
 
     def remove_entity(self, entity):
         position = entity.get(Position)
@@ -72,4 +85,4 @@ class PositionSystem(object):
     def _on_move(self, entity, old_x, old_y, new_x, new_y):
         pos = entity.get(Position)
         self._positions[old_x, old_y].remove((pos.order, entity))
-        insort_right(self._positions[new_x, new_y], (pos.order, entity))
+        _insort_by_order(self._positions[new_x, new_y], pos.order, entity)
@@ -1,17 +1,18 @@
 import collections
+import itertools
 import random
 
 import pyglet
 
-from entity import Component
-from fov import InFOV
+from fov import FOV
 from generator import LayoutGenerator
 from hud import HUD
 from light import LightOverlay
 from message import LastMessagesView
 from position import Position
-from temp import floor_tex, get_wall_tex, dungeon_tex
-from util import event_property
+from renderable import Renderable
+from temp import floor_tex
+from textures import get_image, get_wall_tex, dungeon_tex
 
 
 class TextureGroup(pyglet.graphics.TextureGroup):
@@ -80,71 +81,352 @@ class CameraGroup(pyglet.graphics.Group):
         return hash((self.window, self.zoom_factor, self.parent))
 
 
+class ChunkCuller(object):
+    """
+    Culls level chunks that are out of camera view. Vertex lists of every
+    chunk are kept in the main batch only while the chunk is visible,
+    otherwise they're migrated to a hidden batch which is never drawn.
+    Migration only happens when a chunk enters or leaves the view, and
+    the draw order is kept, because vertex lists keep their groups.
+    """
+
+    def __init__(self, batch, chunk_size):
+        self.chunk_size = chunk_size
+        self._batch = batch
+        self._hidden_batch = pyglet.graphics.Batch()
+        self._chunks = collections.defaultdict(list)
+        self._visible = set()
+
+    def add(self, key, vlist, mode, group):
+        """Add vertex list of chunk with given key. The vertex list must be created in the hidden batch."""
+        self._chunks[key].append((vlist, mode, group))
+        if key in self._visible:
+            self._hidden_batch.migrate(vlist, mode, group, self._batch)
+
+    def get_chunk_key(self, x, y):
+        return x // self.chunk_size, y // self.chunk_size
+
+    @property
+    def hidden_batch(self):
+        return self._hidden_batch
+
+    def update(self, x1, y1, x2, y2):
+        """Make chunks intersecting the rectangle (in tiles) visible and hide all the others"""
+        chunk_x1, chunk_y1 = self.get_chunk_key(x1, y1)
+        chunk_x2, chunk_y2 = self.get_chunk_key(x2, y2)
+        visible = set()
+        for chunk_x in xrange(chunk_x1, chunk_x2 + 1):
+            for chunk_y in xrange(chunk_y1, chunk_y2 + 1):
+                visible.add((chunk_x, chunk_y))
+
+        for key in self._visible - visible:
+            for vlist, mode, group in self._chunks.get(key, ()):
+                self._batch.migrate(vlist, mode, group, self._hidden_batch)
+        for key in visible - self._visible:
+            for vlist, mode, group in self._chunks.get(key, ()):
+                self._hidden_batch.migrate(vlist, mode, group, self._batch)
+        self._visible = visible
+
+
+class SpritePool(object):
+    """
+    Pool of reusable sprites. Released sprites are hidden and kept for later
+    instead of being deleted, so acquiring a sprite usually only changes the
+    image, group and position of an old one instead of allocating a new one
+    and adding it to the batch.
+    """
+
+    def __init__(self, batch):
+        self._batch = batch
+        self._free = []
+        self.in_use = 0
+        self.allocations = 0
+        self.reuses = 0
+
+    def acquire(self, image, x, y, group):
+        if self._free:
+            sprite = self._free.pop()
+            sprite.image = image
+            sprite.group = group
+            sprite.set_position(x, y)
+            sprite.visible = True
+            self.reuses += 1
+        else:
+            sprite = pyglet.sprite.Sprite(image, x, y, batch=self._batch, group=group)
+            self.allocations += 1
+        self.in_use += 1
+        return sprite
+
+    def release(self, sprite):
+        sprite.visible = False
+        if isinstance(sprite.image, pyglet.image.Animation):
+            # don't keep animating hidden sprites
+            sprite.image = sprite.image.frames[0].image
+        self._free.append(sprite)
+        self.in_use -= 1
+
+    def get_stats(self):
+        """
+        Return sprite pool metrics: number of sprites in use and free ones
+        kept for reuse, and total number of sprite allocations and reuses
+        (compare these between turns to get allocation rate).
+        """
+        return {
+            'in_use': self.in_use,
+            'free': len(self._free),
+            'allocations': self.allocations,
+            'reuses': self.reuses,
+        }
+
+    def delete(self):
+        for sprite in self._free:
+            sprite.delete()
+        self._free = []
+
+
 class Animation(pyglet.event.EventDispatcher):
+    """
+    Base animation class. It doesn't schedule anything itself, all running
+    animations are updated by the Animator. Override update and finish
+    methods in subclasses, or use on_update and on_finish events.
+    """
 
     def __init__(self, duration):
         self.elapsed = 0.0
         self.duration = duration
-        pyglet.clock.schedule_interval(self._animate, 0.001)
-
-    def cancel(self):
-        pyglet.clock.unschedule(self._animate)
-        self.dispatch_event('on_finish', self)
 
     def get_elapsed_ratio(self):
         return self.elapsed / self.duration
 
-    def _animate(self, dt):
-        self.elapsed += dt
-        if self.elapsed > self.duration:
-            self.cancel()
-        else:
-            self.dispatch_event('on_update', self, dt)
+    def update(self, dt):
+        self.dispatch_event('on_update', self, dt)
+
+    def finish(self):
+        self.dispatch_event('on_finish', self)
 
 Animation.register_event_type('on_update')
 Animation.register_event_type('on_finish')
 
 
-class Renderable(Component):
-
-    COMPONENT_NAME = 'renderable'
-
-    def __init__(self, image, memorable=False):
-        self._image = image
-        self.memorable = memorable
-
-    image = event_property('_image', 'image_change')
-
-
-class LayoutRenderable(Component):
-
-    COMPONENT_NAME = 'layout_renderable'
-
-    def __init__(self, tile):
-        self.tile = tile
+class MoveAnimation(Animation):
+    """Move sprite from its current position to the target one"""
+
+    def __init__(self, sprite, target_x, target_y, duration):
+        super(MoveAnimation, self).__init__(duration)
+        self.sprite = sprite
+        self.start_x = sprite.x
+        self.start_y = sprite.y
+        self.target_x = target_x
+        self.target_y = target_y
+
+    def update(self, dt):
+        ratio = self.elapsed / self.duration
+        x = round(self.start_x + (self.target_x - self.start_x) * ratio)
+        y = round(self.start_y + (self.target_y - self.start_y) * ratio)
+        self.sprite.set_position(x, y)
+
+    def finish(self):
+        self.sprite.set_position(self.target_x, self.target_y)
+        super(MoveAnimation, self).finish()
+
+
+class RiseAndFadeAnimation(Animation):
+    """Move label up by given distance, fading it out"""
+
+    def __init__(self, label, distance, duration):
+        super(RiseAndFadeAnimation, self).__init__(duration)
+        self.label = label
+        self.distance = distance
+        self.start_y = label.y
+        self.color = label.color[:3]
+
+    def update(self, dt):
+        ratio = self.elapsed / self.duration
+        label = self.label
+        # change both properties in a single layout update
+        label.begin_update()
+        label.y = self.start_y + self.distance * ratio
+        label.color = self.color + (int((1.0 - ratio) * 255),)
+        label.end_update()
+
+
+class Animator(object):
+    """
+    Runs all animations from a single clock callback, which is only scheduled
+    while there are running animations. Animation added with a key replaces
+    the running animation with the same key (e.g. the same sprite moving
+    again), which is finished right away. If there are more than
+    max_animations running, the oldest ones are finished right away too,
+    so heavy fights don't flood the clock.
+    """
+
+    def __init__(self, max_animations=100):
+        self.max_animations = max_animations
+        self._animations = collections.OrderedDict()
+        self._scheduled = False
+
+    def add(self, animation, key=None):
+        if key is None:
+            key = animation
+
+        self.finish(key)
+
+        self._animations[key] = animation
+        while len(self._animations) > self.max_animations:
+            key, old_animation = self._animations.popitem(last=False)
+            old_animation.finish()
+
+        if not self._scheduled:
+            pyglet.clock.schedule(self._tick)
+            self._scheduled = True
+
+    def finish(self, key):
+        """Finish running animation with the given key, if there is one"""
+        animation = self._animations.pop(key, None)
+        if animation is not None:
+            animation.finish()
+
+    def finish_all(self):
+        while self._animations:
+            key, animation = self._animations.popitem(last=False)
+            animation.finish()
+        self._unschedule()
+
+    def _unschedule(self):
+        if self._scheduled:
+            pyglet.clock.unschedule(self._tick)
+            self._scheduled = False
+
+    def _tick(self, dt):
+        finished = []
+        for key, animation in self._animations.items():
+            animation.elapsed += dt
+            if animation.elapsed > animation.duration:
+                finished.append(key)
+            else:
+                animation.update(dt)
+
+        for key in finished:
+            self._animations.pop(key).finish()
+
+        if not self._animations:
+            self._unschedule()
+
+
+class DamageNumbers(object):
+    """
+    Floating damage numbers. Labels are reused from a pool instead of being
+    created for every hit, and hits on the same tile coming within merge_time
+    seconds from each other (e.g. during a single turn) are summed up into a
+    single number.
+    """
+
+    def __init__(self, animator, batch, group, zoom, merge_time=0.1):
+        self.merge_time = merge_time
+        self._animator = animator
+        self._batch = batch
+        self._group = group
+        self._zoom = zoom
+        self._free = []
+        self._active = {}
+        self._tiles = {}
+
+    def add(self, x, y, dmg):
+        active = self._active.get((x, y))
+        if active is not None and active[0].elapsed < self.merge_time:
+            active[1] += dmg
+            active[0].label.text = '-%d' % active[1]
+            return
+
+        label_x = (x * 8 + random.randint(2, 6)) * self._zoom
+        label_y = (y * 8 + random.randint(0, 4)) * self._zoom
+        text = '-%d' % dmg
+
+        if self._free:
+            label = self._free.pop()
+            label.begin_update()
+            label.text = text
+            label.x = label_x
+            label.y = label_y
+            label.color = (255, 0, 0, 255)
+            label.end_update()
+        else:
+            label = pyglet.text.Label(text, font_name='eight2empire', color=(255, 0, 0, 255),
+                x=label_x, y=label_y, anchor_x='center', anchor_y='bottom',
+                batch=self._batch, group=self._group)
+
+        anim = RiseAndFadeAnimation(label, 12 * self._zoom, 1)
+        anim.push_handlers(on_finish=self._on_finish)
+        self._active[x, y] = [anim, dmg]
+        self._tiles[anim] = x, y
+        self._animator.add(anim)
+
+    def _on_finish(self, anim):
+        tile = self._tiles.pop(anim)
+        if self._active[tile][0] is anim:
+            del self._active[tile]
+        anim.label.text = ''
+        self._free.append(anim.label)
+
+    def delete(self):
+        for label in self._free:
+            label.delete()
+        self._free = []
 
 
 class RenderSystem(object):
 
     zoom = 3
 
+    # size of level chunk side in tiles, see ChunkCuller
+    CHUNK_SIZE = 16
+
     GROUP_LEVEL = pyglet.graphics.OrderedGroup(0)
     GROUP_DIGITS = pyglet.graphics.OrderedGroup(1)
     GROUP_HUD = pyglet.graphics.OrderedGroup(2)
 
-    def __init__(self, level):
+    def __init__(self, level, window):
         self._level = level
-        self._window = level.game.game.window
+        self._window = window
         self._batch = pyglet.graphics.Batch()
-        self._animations = set()
+        self._animator = Animator()
         self._sprites = {}
-        self._level_vlist = None
+        self._culler = ChunkCuller(self._batch, self.CHUNK_SIZE)
+        self._level_vlists = []
         self._light_overlay = None
         self._last_messages_view = LastMessagesView(level.game.message_log, self._window.width, self._window.height, batch=self._batch, group=self.GROUP_HUD)
         self._hud = HUD(batch=self._batch, group=self.GROUP_HUD)
         self._level_group = ZoomGroup(self.zoom, CameraGroup(self._window, self.zoom, self.GROUP_LEVEL))
         self._digits_group = CameraGroup(self._window, self.zoom, self.GROUP_DIGITS)
+        self._damage_numbers = DamageNumbers(self._animator, self._batch, self._digits_group, self.zoom)
         self._memory = collections.defaultdict(list)
+        self._memory_pool = SpritePool(self._batch)
+        self._groups = {}
+        self._attach()
+
+    def _attach(self):
+        self.render_level()
+        for entity, renderable, pos in self._level.components.query(Renderable, Position):
+            self.add_entity(entity)
+        self.update_player()
+        self.update_light(self._level.player.get(FOV).lightmap.keys(), (), ())
+        self._level.push_handlers(
+            on_entity_add=self.add_entity,
+            on_entity_remove=self.remove_entity,
+            on_take_damage=self._on_take_damage,
+            on_light_update=self.update_light,
+            on_ambient_light_update=self._on_ambient_light_update,
+        )
+
+    def _get_group(self, order):
+        # level groups are shared by all sprites with the same render order
+        group = self._groups.get(order)
+        if group is None:
+            group = self._groups[order] = pyglet.graphics.OrderedGroup(order, self._level_group)
+        return group
+
+    def get_memory_stats(self):
+        return self._memory_pool.get_stats()
 
     def update_player(self):
         player_sprite = self._sprites[self._level.player]
@@ -153,154 +435,163 @@ class RenderSystem(object):
         self._hud.player = self._level.player
 
     def render_level(self):
-        vertices = []
-        tex_coords = []
-
-        for x in xrange(self._level.size_x):
-            for y in xrange(self._level.size_y):
-                x1 = x * 8
-                x2 = x1 + 8
-                y1 = y * 8
-                y2 = y1 + 8
-
-                for entity in self._level.position_system.get_entities_at(x, y):
-                    renderable = entity.get(LayoutRenderable)
-                    if renderable:
-                        tile = renderable.tile
-                        break
-                else:
-                    continue
-
-                # always add floor, because we wanna draw walls above floor
-                vertices.extend((x1, y1, x2, y1, x2, y2, x1, y2))
-                tex_coords.extend(floor_tex.tex_coords)
+        group = TextureGroup(dungeon_tex, pyglet.graphics.OrderedGroup(Position.ORDER_FLOOR, self._level_group))
 
-                if tile == LayoutGenerator.TILE_WALL:
-                    # if we got wall, draw it above floor
-                    tex = get_wall_tex(self._level.get_wall_transition(x, y))
-                    vertices.extend((x1, y1, x2, y1, x2, y2, x1, y2))
-                    tex_coords.extend(tex.tex_coords)
+        for chunk_x in xrange(0, self._level.size_x, self.CHUNK_SIZE):
+            for chunk_y in xrange(0, self._level.size_y, self.CHUNK_SIZE):
+                vertices = []
+                tex_coords = []
+
+                for x in xrange(chunk_x, min(chunk_x + self.CHUNK_SIZE, self._level.size_x)):
+                    for y in xrange(chunk_y, min(chunk_y + self.CHUNK_SIZE, self._level.size_y)):
+                        x1 = x * 8
+                        x2 = x1 + 8
+                        y1 = y * 8
+                        y2 = y1 + 8
+
+                        tile = self._level.terrain.get_tile(x, y)
+                        if tile == LayoutGenerator.TILE_EMPTY:
+                            continue
+
+                        # always add floor, because we wanna draw walls above floor
+                        vertices.extend((x1, y1, x2, y1, x2, y2, x1, y2))
+                        tex_coords.extend(get_image(floor_tex).tex_coords)
+
+                        if tile == LayoutGenerator.TILE_WALL:
+                            # if we got wall, draw it above floor
+                            tex = get_wall_tex(self._level.get_wall_transition(x, y))
+                            vertices.extend((x1, y1, x2, y1, x2, y2, x1, y2))
+                            tex_coords.extend(tex.tex_coords)
+
+                if not vertices:
+                    continue
 
-        group = TextureGroup(dungeon_tex, pyglet.graphics.OrderedGroup(Position.ORDER_FLOOR, self._level_group))
-        self._level_vlist = self._batch.add(len(vertices) / 2, pyglet.gl.GL_QUADS, group,
-            ('v2i/static', vertices),
-            ('t3f/statc', tex_coords),
-        )
+                vlist = self._culler.hidden_batch.add(len(vertices) / 2, pyglet.gl.GL_QUADS, group,
+                    ('v2i/static', vertices),
+                    ('t3f/statc', tex_coords),
+                )
+                self._level_vlists.append(vlist)
+                self._culler.add(self._culler.get_chunk_key(chunk_x, chunk_y), vlist, pyglet.gl.GL_QUADS, group)
 
         group = pyglet.graphics.OrderedGroup(Position.ORDER_PLAYER + 1, self._level_group)
-        self._light_overlay = LightOverlay(self._level.size_x, self._level.size_y, self._batch, group)
-
-    def update_light(self, old_lightmap, new_lightmap):
-        # for all changed cells
-        for key in set(old_lightmap).union(new_lightmap):
-            lit = key in new_lightmap
+        self._light_overlay = LightOverlay(self._level.size_x, self._level.size_y, self._culler, group)
+
+    def _update_culling(self):
+        # calculate level area seen by camera (in tiles) from its focus and window size
+        focus = self._level_group.parent.focus
+        half_x = self._window.width / 2.0 / self.zoom
+        half_y = self._window.height / 2.0 / self.zoom
+        x1 = int((focus.x - half_x) // 8)
+        y1 = int((focus.y - half_y) // 8)
+        x2 = int((focus.x + half_x) // 8)
+        y2 = int((focus.y + half_y) // 8)
+        self._culler.update(x1, y1, x2, y2)
+
+    def update_light(self, lit, darkened, changed):
+        # for cells that became lit, clear all memory sprites, if there are any, and show entity sprites
+        for key in lit:
             memory = self._memory[key]
+            for sprite in memory:
+                self._memory_pool.release(sprite)
+            memory[:] = []
 
-            # if cell is lit, add it to memory and clear all memory sprites, if there are any
-            if lit:
-                for sprite in memory:
-                    sprite.delete()
-                memory[:] = []
-
-            # for every entity in cell
             for entity in self._level.position_system.get_entities_at(*key):
-                # set in_fov flag
-                # TODO: this doesnt belong to rendering, but i don't want to loop twice
-                infov = entity.get(InFOV)
-                if infov:
-                    infov.in_fov = key in new_lightmap
+                if entity.has(Renderable):
+                    self._sprites[entity].visible = True
 
-                # if renderable, manage sprites/memory
+        # for cells that became dark, hide entity sprites and add memorable ones to the memory
+        for key in darkened:
+            memory = self._memory[key]
+
+            for entity in self._level.position_system.get_entities_at(*key):
                 renderable = entity.get(Renderable)
                 if not renderable:
                     continue
 
-                # if object is lit, show its sprite
-                sprite = self._sprites[entity]
-                if lit:
-                    sprite.visible = True
-                else:
-                    sprite.visible = False
-
-                    # if it's memorable, add its current image to the memory
-                    if renderable.memorable:
-                        pos = entity.get(Position)
-                        group = pyglet.graphics.OrderedGroup(pos.order, self._level_group)
-                        sprite = pyglet.sprite.Sprite(renderable.image, pos.x * 8, pos.y * 8, batch=self._batch, group=group)
-                        memory.append(sprite)
+                self._sprites[entity].visible = False
 
+                # if it's memorable, add its current image to the memory
+                if renderable.memorable:
+                    pos = entity.get(Position)
+                    sprite = self._memory_pool.acquire(get_image(renderable.image), pos.x * 8, pos.y * 8, self._get_group(pos.order))
+                    memory.append(sprite)
 
         # update light overlay
-        self._light_overlay.update_light(new_lightmap, self._memory)
+        self._update_overlay(itertools.chain(lit, darkened, changed))
+
+    def _on_ambient_light_update(self, keys):
+        self._update_overlay(keys)
+
+    def _update_overlay(self, keys):
+        self._light_overlay.update_light(keys, self._level.player.get(FOV).lightmap, self._memory, self._level.light_system.light)
 
     def add_entity(self, entity):
-        image = entity.get(Renderable).image
+        if not entity.has(Renderable) or not entity.has(Position):
+            return
+        image = get_image(entity.get(Renderable).image)
         pos = entity.get(Position)
-        group = pyglet.graphics.OrderedGroup(pos.order, self._level_group)
-        sprite = pyglet.sprite.Sprite(image, pos.x * 8, pos.y * 8, batch=self._batch, group=group)
+        sprite = pyglet.sprite.Sprite(image, pos.x * 8, pos.y * 8, batch=self._batch, group=self._get_group(pos.order))
         self._sprites[entity] = sprite
         entity.listen('image_change', self._on_image_change)
         entity.listen('move', self._on_move)
 
     def remove_entity(self, entity):
+        if entity not in self._sprites:
+            return
         sprite = self._sprites.pop(entity)
         sprite.delete()
         entity.unlisten('image_change', self._on_image_change)
         entity.unlisten('move', self._on_move)
 
     def _on_image_change(self, entity):
-        self._sprites[entity].image = entity.get(Renderable).image
+        self._sprites[entity].image = get_image(entity.get(Renderable).image)
 
     def _on_move(self, entity, old_x, old_y, new_x, new_y):
         sprite = self._sprites[entity]
         target_x = new_x * 8
         target_y = new_y * 8
 
+        # if sprite is still moving, finish previous animation first, so the
+        # new one starts from its target and not from the middle of the way
+        self._animator.finish(sprite)
+
         if not sprite.visible:
             # don't animate invisible sprites
             sprite.set_position(target_x, target_y)
         else:
-            start_x = sprite.x
-            start_y = sprite.y
-
-            anim = Animation(0.25)
-
-            @anim.event
-            def on_update(animation, dt, sprite=sprite, dx=(target_x - start_x), dy=(target_y - start_y)):
-                ratio = animation.get_elapsed_ratio()
-                x = round(start_x + dx * ratio)
-                y = round(start_y + dy * ratio)
-                sprite.set_position(x, y)
-
-            @anim.event
-            def on_finish(animation, sprite=sprite):
-                sprite.set_position(target_x, target_y)
-
-            self.add_animation(anim)
+            self.add_animation(MoveAnimation(sprite, target_x, target_y, 0.25), key=sprite)
 
     def draw(self):
         self._window.clear()
         pyglet.gl.glEnable(pyglet.gl.GL_BLEND)
         pyglet.gl.glBlendFunc(pyglet.gl.GL_SRC_ALPHA, pyglet.gl.GL_ONE_MINUS_SRC_ALPHA)
+        self._update_culling()
         self._batch.draw()
 
     def dispose(self):
-        for anim in tuple(self._animations):
-            anim.cancel()
-        assert not self._animations
+        self._level.remove_handlers(
+            on_entity_add=self.add_entity,
+            on_entity_remove=self.remove_entity,
+            on_take_damage=self._on_take_damage,
+            on_light_update=self.update_light,
+            on_ambient_light_update=self._on_ambient_light_update,
+        )
 
-        for sprite in self._sprites.values():
-            sprite.delete()
-        self._sprites.clear()
+        self._animator.finish_all()
+        self._damage_numbers.delete()
+
+        for entity in self._sprites.keys():
+            self.remove_entity(entity)
 
         for sprites in self._memory.values():
             for sprite in sprites:
-                sprite.delete()
+                self._memory_pool.release(sprite)
         self._memory.clear()
+        self._memory_pool.delete()
 
-        if self._level_vlist:
-            self._level_vlist.delete()
-            self._level_vlist = None
+        for vlist in self._level_vlists:
+            vlist.delete()
+        self._level_vlists = []
 
         if self._light_overlay:
             self._light_overlay.delete()
@@ -309,28 +600,50 @@ class RenderSystem(object):
         self._last_messages_view.delete()
         self._hud.delete()
 
-    def add_animation(self, animation):
-        self._animations.add(animation)
-        animation.push_handlers(on_finish=self._animations.remove)
-
-    def animate_damage(self, x, y, dmg):
-        x = (x * 8 + random.randint(2, 6)) * self.zoom
-        start_y = (y * 8 + random.randint(0, 4)) * self.zoom
+    def add_animation(self, animation, key=None):
+        self._animator.add(animation, key)
 
-        label = pyglet.text.Label('-' + str(dmg), font_name='eight2empire', color=(255, 0, 0, 255),
-            x=x, y=start_y, anchor_x='center', anchor_y='bottom',
-            batch=self._batch, group=self._digits_group)
-
-        anim = Animation(1)
-
-        @anim.event
-        def on_update(animation, dt, label=label, start_y=start_y, zoom=self.zoom):
-            ratio = animation.get_elapsed_ratio()
-            label.y = start_y + 12 * ratio * zoom
-            label.color = (255, 0, 0, int((1.0 - ratio) * 255))
-
-        @anim.event
-        def on_finish(animation, label=label):
-            label.delete()
+    def _on_take_damage(self, entity, amount, source):
+        pos = entity.get(Position)
+        self.animate_damage(pos.x, pos.y, amount)
 
-        self.add_animation(anim)
+    def animate_damage(self, x, y, dmg):
+        self._damage_numbers.add(x, y, dmg)
+
+
+if __name__ == '__main__':
+    # benchmark drawing a level with several hundred sprites, using shared
+    # render order groups vs a new group per sprite (as it was done before)
+    import time
+
+    from description import Description
+    from entity import Entity
+    from simulate import Simulation
+    from temp import gold_texes
+
+    window = pyglet.window.Window(1024, 768, visible=False)
+    sim = Simulation(100, 100)
+    level = sim.level
+    for i in xrange(500):
+        room = random.choice(level._layout.rooms)
+        x = random.randrange(room.x + 1, room.x + room.grid.size_x - 1)
+        y = random.randrange(room.y + 1, room.y + room.grid.size_y - 1)
+        level.add_entity(Entity(Description('Gold'), Renderable(random.choice(gold_texes)), Position(x, y, Position.ORDER_ITEMS)))
+    render_system = RenderSystem(level, window)
+
+    def measure(frames=300):
+        start = time.time()
+        for i in xrange(frames):
+            render_system.draw()
+            pyglet.gl.glFinish()
+        return (time.time() - start) / frames * 1000
+
+    def count_groups():
+        return len(set(id(sprite.group) for sprite in render_system._sprites.values())), len(render_system._batch.group_map)
+
+    print '%d sprites' % len(render_system._sprites)
+    print 'shared groups: %.3f ms per frame, %d sprite groups, %d batch groups' % ((measure(),) + count_groups())
+
+    for sprite in render_system._sprites.values():
+        sprite.group = pyglet.graphics.OrderedGroup(sprite.group.order, render_system._level_group)
+    print 'group per sprite: %.3f ms per frame, %d sprite groups, %d batch groups' % ((measure(),) + count_groups())
@@ -0,0 +1,25 @@
+from entity import Component
+from util import event_property
+
+
+class Renderable(Component):
+
+    COMPONENT_NAME = 'renderable'
+
+    __slots__ = ('_image', 'memorable')
+
+    def __init__(self, image, memorable=False):
+        self._image = image
+        self.memorable = memorable
+
+    image = event_property('_image', 'image_change')
+
+
+class LayoutRenderable(Component):
+
+    COMPONENT_NAME = 'layout_renderable'
+
+    __slots__ = ('tile',)
+
+    def __init__(self, tile):
+        self.tile = tile
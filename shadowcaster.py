@@ -1,3 +1,7 @@
+from array import array
+from collections import OrderedDict
+
+
 class ShadowCaster(object):
     """
     Recursive shadow casting algorithm implementation
@@ -110,3 +114,234 @@ class ShadowCaster(object):
 
     def calculate_intensity(self, dist_squared, radius_squared):
         return 1.0 - float(dist_squared) / float(radius_squared)
+
+
+# maximum number of cached slope tables, see get_slope_table
+MAX_SLOPE_TABLES = 16
+
+_slope_tables = OrderedDict()
+
+def get_slope_table(radius):
+    """
+    Return precalculated octant scan data for the given radius. It's a list
+    indexed by row number (distance from the light source along the main axis),
+    where every row is a tuple of (dx, l_slope, r_slope, intensity) tuples in
+    the scanning order, intensity being 0 for cells outside the light radius.
+
+    Tables only depend on the radius, so they're shared by all casters.
+    Only MAX_SLOPE_TABLES most recently used tables are kept in memory.
+    """
+    table = _slope_tables.pop(radius, None)
+    if table is None:
+        radius_squared = float(radius * radius)
+        table = [()]
+        for j in xrange(1, radius + 1):
+            dy = -j
+            row = []
+            for dx in xrange(-j, 1):
+                dist_squared = dx * dx + dy * dy
+                intensity = 1.0 - dist_squared / radius_squared if dist_squared < radius_squared else 0.0
+                row.append((dx, (dx - 0.5) / (dy + 0.5), (dx + 0.5) / (dy - 0.5), intensity))
+            table.append(tuple(row))
+        if len(_slope_tables) >= MAX_SLOPE_TABLES:
+            _slope_tables.popitem(last=False)
+    _slope_tables[radius] = table
+    return table
+
+
+class GridShadowCaster(object):
+    """
+    Fast variant of the ShadowCaster working with dense grids instead of
+    callbacks. It's meant to be created once and reused for every update.
+
+    blocking is a sequence of size_x * size_y values indexed by
+    y * size_x + x (e.g. a bytearray), where non-zero value means that
+    the cell is blocking view. It's read directly, so any changes to it
+    are visible in the next calculation. Cells out of grid bounds are
+    considered blocking.
+
+    After calling calculate_light(x, y, radius), intensity array
+    contains light intensity for every lit cell (with the same linear
+    attenuation as in ShadowCaster.calculate_intensity) and lit list
+    contains indexes of these cells. Intensities from the previous
+    calculation are reset at the start of the next one, so the cost
+    of it depends on the radius, not on the grid size.
+
+    Slopes and intensities are not calculated while scanning, but taken
+    from the shared per-radius table (see get_slope_table).
+
+    When blocking state of a single cell changes, call update_cell(x, y)
+    instead of full recalculation. Cells lit by every octant are tracked
+    separately, so only octants containing the changed cell are recast.
+    """
+
+    mult = ShadowCaster.mult
+
+    def __init__(self, size_x, size_y, blocking):
+        self.size_x = size_x
+        self.size_y = size_y
+        self.blocking = blocking
+        self.intensity = array('d', [0.0]) * (size_x * size_y)
+        self.x = None
+        self.y = None
+        self.radius = None
+        # bitmask of octants that lit every cell and lists of cells lit by every octant
+        self._octant_bits = bytearray(size_x * size_y)
+        self._octant_lit = [[] for oct in xrange(8)]
+
+    @property
+    def lit(self):
+        if self.x is None:
+            return []
+        result = [self.y * self.size_x + self.x]
+        octant_bits = self._octant_bits
+        for oct in xrange(8):
+            bit = 1 << oct
+            for idx in self._octant_lit[oct]:
+                # cells on octant borders are lit by two octants, list them only for the first one
+                bits = octant_bits[idx]
+                if bits & -bits == bit:
+                    result.append(idx)
+        return result
+
+    def calculate_light(self, x, y, radius):
+        if self.x is not None:
+            self.intensity[self.y * self.size_x + self.x] = 0.0
+            for oct in xrange(8):
+                self._reset_octant(oct)
+
+        self.x = x
+        self.y = y
+        self.radius = radius
+
+        # the light source cell is always fully lit
+        self.intensity[y * self.size_x + x] = 1.0
+
+        for oct in xrange(8):
+            self._cast_octant(oct)
+
+    def update_cell(self, x, y):
+        """Update light after blocking state of the given cell has changed"""
+        rx = x - self.x
+        ry = y - self.y
+        mult = self.mult
+        for oct in xrange(8):
+            # translate map offset to octant coordinates (octant transform matrix is orthogonal,
+            # so inverse is just transposed) and check whether the cell is scanned by this octant
+            dx = mult[0][oct] * rx + mult[2][oct] * ry
+            dy = mult[1][oct] * rx + mult[3][oct] * ry
+            if -self.radius <= dy < 0 and dy <= dx <= 0:
+                self._reset_octant(oct)
+                self._cast_octant(oct)
+
+    def _reset_octant(self, oct):
+        mask = ~(1 << oct)
+        intensity = self.intensity
+        octant_bits = self._octant_bits
+        for idx in self._octant_lit[oct]:
+            bits = octant_bits[idx] & mask
+            octant_bits[idx] = bits
+            if not bits:
+                intensity[idx] = 0.0
+        self._octant_lit[oct] = []
+
+    def _cast_octant(self, oct):
+        mult = self.mult
+        self._cast_light(self.x, self.y, 1, 1.0, 0.0, self.radius, get_slope_table(self.radius),
+            mult[0][oct], mult[1][oct], mult[2][oct], mult[3][oct],
+            self._octant_lit[oct], 1 << oct)
+
+    def _cast_light(self, cx, cy, row, start_slope, end_slope, radius, table, xx, xy, yx, yy, lit, bit):
+        if start_slope < end_slope:
+            return
+
+        # same algorithm as in ShadowCaster, but with everything needed
+        # in the inner loop bound to local variables
+        size_x = self.size_x
+        size_y = self.size_y
+        blocking = self.blocking
+        intensity = self.intensity
+        octant_bits = self._octant_bits
+
+        for j in xrange(row, radius + 1):
+            dy = -j
+            blocked = False
+
+            for dx, l_slope, r_slope, light in table[j]:
+                if start_slope < r_slope:
+                    continue
+                elif end_slope > l_slope:
+                    break
+
+                map_x = cx + dx * xx + dy * xy
+                map_y = cy + dx * yx + dy * yy
+
+                if 0 <= map_x < size_x and 0 <= map_y < size_y:
+                    idx = map_y * size_x + map_x
+                    if light:
+                        bits = octant_bits[idx]
+                        if not bits & bit:
+                            octant_bits[idx] = bits | bit
+                            lit.append(idx)
+                        intensity[idx] = light
+                    is_blocking = blocking[idx]
+                else:
+                    is_blocking = True
+
+                if blocked:
+                    if is_blocking:
+                        new_start_slope = r_slope
+                        continue
+                    else:
+                        blocked = False
+                        start_slope = new_start_slope
+                else:
+                    if j < radius and is_blocking:
+                        blocked = True
+                        self._cast_light(cx, cy, j + 1, start_slope, l_slope,
+                            radius, table, xx, xy, yx, yy, lit, bit)
+                        new_start_slope = r_slope
+
+            if blocked:
+                break
+
+
+if __name__ == '__main__':
+    import random
+    import time
+
+    random.seed(0)
+    size_x = size_y = 100
+    blocking = bytearray(int(random.random() < 0.1) for i in xrange(size_x * size_y))
+    blocking[size_y / 2 * size_x + size_x / 2] = 0
+    is_blocking = lambda x, y: x < 0 or x >= size_x or y < 0 or y >= size_y or blocking[y * size_x + x]
+    lightmap = {}
+    def set_light(x, y, intensity):
+        lightmap[x, y] = intensity
+
+    callback_caster = ShadowCaster(is_blocking, set_light)
+    grid_caster = GridShadowCaster(size_x, size_y, blocking)
+    updates = 200
+
+    for radius in (10, 30):
+        start = time.time()
+        for i in xrange(updates):
+            callback_caster.calculate_light(size_x / 2, size_y / 2, radius)
+        callback_time = (time.time() - start) / updates
+
+        start = time.time()
+        for i in xrange(updates):
+            grid_caster.calculate_light(size_x / 2, size_y / 2, radius)
+        grid_time = (time.time() - start) / updates
+
+        # toggle random cells near the light source (and back) like doors do
+        start = time.time()
+        for i in xrange(updates / 2):
+            x = size_x / 2 + random.randint(1, radius / 2)
+            y = size_y / 2 + random.randint(1, radius / 2)
+            for toggle in xrange(2):
+                blocking[y * size_x + x] ^= 1
+                grid_caster.update_cell(x, y)
+        cell_time = (time.time() - start) / updates
+
+        print 'radius %d: ShadowCaster %.3f ms, GridShadowCaster %.3f ms per update, %.3f ms per cell update' % (radius, callback_time * 1000, grid_time * 1000, cell_time * 1000)
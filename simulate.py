@@ -0,0 +1,65 @@
+"""
+Headless level simulation
+
+Runs the level logic without any window, GL context or textures, feeding
+player commands from a callback instead of the keyboard. Useful for balance
+testing and batch-simulating lots of turns.
+"""
+import random
+import time
+
+from command import Command
+from fight import Fighter
+from health import Health
+from level import Level
+from message import MessageLog
+from monster import create_random_monster
+
+
+def random_command(level):
+    rng = level.game.rng
+    return Command(Command.MOVE, (rng.randint(-1, 1), rng.randint(-1, 1)))
+
+
+class Simulation(object):
+
+    def __init__(self, size_x, size_y, command_cb=random_command, seed=None):
+        # commands get their own generator, so they don't affect level streams
+        self.rng = random.Random(seed)
+        self.command_cb = command_cb
+        self.message_log = MessageLog()
+        self.level = Level(self, size_x, size_y, seed)
+
+    def get_command(self):
+        command = self.command_cb(self.level)
+        self.message_log.mark_as_seen()
+        return command
+
+    def run(self, ticks):
+        for i in xrange(ticks):
+            self.level.tick()
+
+
+def check_fatal_hit_messages():
+    """Check that a fatal hit is logged before the death, as component event order depends on the order of adding"""
+    sim = Simulation(40, 40, seed=0)
+    player = sim.level.player
+    player.get(Health).health = 1
+    monster = create_random_monster(0, 0, sim.level.rng.population)
+    monster.get(Fighter).do_attack(player)
+    hit, death = list(sim.message_log.messages)[-2:]
+    assert hit.endswith('hits you for 1 hp') and death.endswith('You die'), (hit, death)
+
+
+if __name__ == '__main__':
+    check_fatal_hit_messages()
+
+    start = time.time()
+    sim = Simulation(100, 100)
+    print 'level created in %.3f s' % (time.time() - start)
+
+    ticks = 10000
+    start = time.time()
+    sim.run(ticks)
+    elapsed = time.time() - start
+    print '%d ticks in %.3f s (%d ticks/s)' % (ticks, elapsed, ticks / elapsed)
@@ -0,0 +1,49 @@
+from blocker import Blocker
+from description import Description
+from entity import Entity
+from generator import LayoutGenerator
+from position import Position
+from renderable import LayoutRenderable
+
+
+_WALL_BLOCKING = ''.join('\x01' if chr(i) == LayoutGenerator.TILE_WALL else '\x00' for i in xrange(256))
+
+
+class Terrain(object):
+    """
+    Static floor and walls of a level. They are kept only as the layout tile
+    grid instead of an entity per tile. When something needs a terrain tile
+    as an entity (e.g. to get description of a wall that was bumped into),
+    it's created on demand and cached, so a tile always gives the same entity.
+    Those entities are not added to the level.
+    """
+
+    def __init__(self, grid):
+        self.grid = grid
+        self.size_x = grid.size_x
+        self.size_y = grid.size_y
+        self._entities = {}
+
+    def get_tile(self, x, y):
+        return self.grid[x, y]
+
+    def is_wall(self, x, y):
+        return self.grid[x, y] == LayoutGenerator.TILE_WALL
+
+    def get_blocking_map(self):
+        """Return a bytearray with 1 for every wall tile and 0 for others, row by row"""
+        # grid is stored row by row, so the whole grid is one long row
+        return bytearray(self.grid.get_row(0, 0, self.size_x * self.size_y).translate(_WALL_BLOCKING))
+
+    def get_entity(self, x, y):
+        entity = self._entities.get((x, y))
+        if entity is None:
+            tile = self.grid[x, y]
+            if tile == LayoutGenerator.TILE_EMPTY:
+                return None
+            elif tile == LayoutGenerator.TILE_WALL:
+                entity = Entity(Description('Wall'), Blocker(True, True), LayoutRenderable(tile), Position(x, y, Position.ORDER_WALLS))
+            else:
+                entity = Entity(Description('Floor'), LayoutRenderable(tile), Position(x, y))
+            self._entities[x, y] = entity
+        return entity
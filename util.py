@@ -4,8 +4,26 @@ import math
 import pyglet
 
 
-def randint_triangular(a, b):
-    return int(round(random.triangular(a, b)))
+def randint_triangular(a, b, rng=random):
+    return int(round(rng.triangular(a, b)))
+
+
+class RandomStreams(object):
+    """
+    Independent random number generators derived from a single seed, one
+    for every part of the game that uses randomness, so e.g. combat doesn't
+    shift the layout and population of levels. The same seed always gives
+    the same streams. If no seed is given, a random one is chosen.
+    """
+
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.seed = seed
+        master = random.Random(seed)
+        self.layout = random.Random(master.getrandbits(64))
+        self.population = random.Random(master.getrandbits(64))
+        self.combat = random.Random(master.getrandbits(64))
 
 
 def load_tilegrid(name):